@@ -65,4 +65,6 @@ def login():
 
 # ==================== اجرا ====================
 if __name__ == '__main__':
+    from utils.metrics import metrics
+    metrics.reset()
     app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
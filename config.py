@@ -34,11 +34,39 @@ class Config:
     BRAIN_CONFIG = {
         'similarity_threshold': 0.65,      # آستانه شباهت
         'max_results': 5,                   # حداکثر نتایج
+        'candidate_limit': 200,              # حداکثر کاندید از ایندکس معکوس
+        'candidate_index': 'inverted',       # inverted، lsh یا both
+        'lsh_bands': 16,                      # تعداد باندهای LSH
+        'lsh_rows': 4,                        # ردیف‌های هر باند
+        'partial_match_backend': 'difflib',  # difflib یا myers (فاصله ویرایشی بیت-موازی)
+        'scoring_mode': 'combined',          # combined، tfidf (ماتریس اسپارس)، vector (بردار درهم‌سازی) یا sharded
         'use_stemming': True,                # استفاده از ریشه‌یابی
         'use_synonyms': True,                # استفاده از مترادف
+        'synonyms_file': os.environ.get('SYNONYMS_FILE'),  # فایل JSON مترادف‌ها (اختیاری)
         'cache_size': 10000,                  # حجم کش
+        'text_cache_size': 50000,             # حجم حافظه موقت توکن/ریشه/کلمات کلیدی
         'vector_dimension': 300,              # ابعاد برداری
         'batch_size': 1000,                   # اندازه بatch برای پردازش
+        'fast_tokenizer': 'auto',             # توکن‌ساز تک‌گذر (translate + یک regex)؛ auto: فقط وقتی punkt نصب نیست
+        'matrix_rebuild_delay': 2.0,          # تأخیر بازسازی ماتریس‌ها پس از یادگیری (ثانیه)
+        'consistency_interval': 300,          # فاصله بررسی هماهنگی حافظه با دیتابیس (ثانیه)
+        'history_batch_size': 500,            # تعداد ردیف تاریخچه در هر bulk insert
+        'history_flush_ms': 1000,             # حداکثر تأخیر ذخیره تاریخچه (میلی‌ثانیه)
+        'history_queue_size': 10000,          # ظرفیت صف تاریخچه
+        'history_drop_policy': 'drop_new',    # drop_new، drop_oldest یا block (صف پر)
+        'usage_flush_interval': 5.0,          # فاصله ذخیره آمار استفاده دانش‌ها (ثانیه)
+        'knowledge_sync': True,               # اعلان تغییرات دانش بین کارگرها از طریق Redis
+        'knowledge_version_file': 'logs/knowledge.version',  # شمارنده نسخه جایگزین وقتی Redis در دسترس نیست
+        'sync_interval': 1.0,                 # حداکثر تأخیر اعمال تغییرات کارگرهای دیگر (ثانیه)
+        'sync_overlap': 2.0,                  # هم‌پوشانی زمانی برای اختلاف ساعت کارگرها (ثانیه)
+        'sync_reload_threshold': 500,         # بیش از این تعداد ردیف تغییرکرده، بارگذاری کامل به جای اعمال تکی
+        'answer_cache_l2': True,              # کش جواب مشترک در Redis (L2) پشت کش داخل پردازه (L1)
+        'answer_cache_size': 10000,           # ظرفیت کش جواب داخل پردازه
+        'answer_cache_timeout': 300,          # عمر جواب‌های کش‌شده (ثانیه)
+        'coalesce_timeout': 5.0,              # حداکثر انتظار برای جواب یک سوال هم‌زمان یکسان (ثانیه)
+        'metrics_dir': 'logs/metrics',        # پوشه مشترک متریک‌های کارگرها برای تجمیع در /metrics (None: فقط همین پردازه)
+        'metrics_flush_interval': 5.0,        # فاصله ذخیره متریک‌های هر کارگر (ثانیه)
+        'nltk_download': False,               # دانلود داده‌های NLTK در اولین استفاده (نیاز به شبکه)
         'parallel_workers': 4,                 # تعداد پردازنده‌های موازی
         'answer_quality_threshold': 0.8       # آستانه کیفیت جواب
     }
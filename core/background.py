@@ -0,0 +1,54 @@
+import atexit
+import threading
+
+
+class BackgroundFlusher:
+    """پایه ذخیره‌سازهای پس‌زمینه (تاریخچه، آمار استفاده)
+
+    نخ ذخیره‌ساز در اولین استفاده راه می‌افتد و هنگام خاموش شدن (atexit)
+    باقی‌مانده‌ها را ذخیره می‌کند. اپلیکیشن Flask از اولین فراخوانی داخل
+    app context گرفته می‌شود؛ اگر فراخوانی‌های اول بیرون از آن باشند، تلاش
+    در فراخوانی‌های بعدی ادامه دارد تا ذخیره‌ها بی‌اپلیکیشن نمانند.
+    """
+
+    thread_name = 'background-flusher'
+
+    def __init__(self):
+        self.app = None
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _capture_app(self):
+        from flask import current_app, has_app_context
+        if has_app_context():
+            self.app = current_app._get_current_object()
+
+    def _ensure_started(self):
+        """گرفتن اپلیکیشن (تا موفق شود) و شروع تنبل نخ ذخیره‌ساز"""
+        if self.app is None:
+            self._capture_app()
+        if self.thread is not None:
+            return
+
+        with self.start_lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    def close(self, timeout=5.0):
+        """توقف نخ و ذخیره باقی‌مانده‌ها (هنگام خاموش شدن)"""
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.flush()
@@ -1,18 +1,29 @@
+import os
 import threading
 import time
 import json
 from collections import defaultdict
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 from .similarity import SimilarityEngine
 from .text_processor import TextProcessor
-from models.database import Knowledge, db
-from utils.cache import Cache
+from .index import InvertedIndex, MinHashLSH, UnionIndex
+from .history import WriteBehindWriter
+from .usage import UsageCounter
+from .snapshot import KnowledgeRecord, KnowledgeSnapshot
+from .sync import KnowledgeSync, connect_redis
+from models.database import Knowledge, ChatHistory, db
+from utils.cache import Cache, TieredCache, SingleFlight
+from utils.metrics import metrics
+from config import Config
 import hashlib
 
 class Brain:
     """مغز اصلی هوش مصنوعی - با قابلیت یادگیری و پاسخگویی"""
     
+    # حالت‌هایی که ساختار ماتریسی دارند و به‌روزرسانی تکی‌شان با بازسازی است
+    MATRIX_MODES = ('tfidf', 'vector', 'sharded')
+    
     _instance = None
     _lock = threading.Lock()
     
@@ -31,15 +42,59 @@ class Brain:
     def setup_brain(self):
         """راه‌اندازی مغز"""
         self.text_processor = TextProcessor()
-        self.similarity_engine = SimilarityEngine()
-        self.cache = Cache()
+        self.similarity_engine = SimilarityEngine(
+            cache_size=Config.BRAIN_CONFIG.get('cache_size', 10000),
+            partial_backend=Config.BRAIN_CONFIG.get('partial_match_backend', 'difflib')
+        )
+        
+        # Redis مشترک بین کارگرها (در صورت در دسترس بودن)
+        redis_client = connect_redis(Config.REDIS_URL)
+        
+        # کش جواب: L1 داخل پردازه + L2 در Redis
+        self.cache = TieredCache(
+            redis_client=redis_client if Config.BRAIN_CONFIG.get('answer_cache_l2', True) else None,
+            max_size=Config.BRAIN_CONFIG.get('answer_cache_size', 10000),
+            default_timeout=Config.BRAIN_CONFIG.get('answer_cache_timeout', 300)
+        )
+        self.redis = redis_client
+        
+        # متن جواب دانش‌های انتخاب‌شده (رکوردهای حافظه جواب را نگه نمی‌دارند)
+        self.answer_texts = Cache(
+            max_size=Config.BRAIN_CONFIG.get('answer_cache_size', 10000),
+            default_timeout=3600
+        )
+        
+        # یک محاسبه برای سوالات یکسان هم‌زمان
+        self.inflight = SingleFlight()
+        
+        # ذخیره تاریخچه گفتگو خارج از مسیر درخواست
+        self.history_writer = WriteBehindWriter(
+            ChatHistory,
+            batch_size=Config.BRAIN_CONFIG.get('history_batch_size', 500),
+            flush_interval=Config.BRAIN_CONFIG.get('history_flush_ms', 1000) / 1000,
+            max_queue=Config.BRAIN_CONFIG.get('history_queue_size', 10000),
+            drop_policy=Config.BRAIN_CONFIG.get('history_drop_policy', 'drop_new')
+        )
+        
+        # آمار استفاده دانش‌ها (تجمیع در حافظه، ذخیره دوره‌ای)
+        self.usage_counter = UsageCounter(
+            flush_interval=Config.BRAIN_CONFIG.get('usage_flush_interval', 5.0)
+        )
         
         # تنظیمات
         self.config = {
             'similarity_threshold': 0.65,
             'max_results': 5,
             'learning_rate': 0.1,
-            'min_confidence': 0.5
+            'min_confidence': 0.5,
+            'candidate_limit': Config.BRAIN_CONFIG.get('candidate_limit', 200),
+            'scoring_mode': Config.BRAIN_CONFIG.get('scoring_mode', 'combined'),
+            'parallel_workers': Config.BRAIN_CONFIG.get('parallel_workers', 4),
+            'candidate_index': Config.BRAIN_CONFIG.get('candidate_index', 'inverted'),
+            'lsh_bands': Config.BRAIN_CONFIG.get('lsh_bands', 16),
+            'lsh_rows': Config.BRAIN_CONFIG.get('lsh_rows', 4),
+            'matrix_rebuild_delay': Config.BRAIN_CONFIG.get('matrix_rebuild_delay', 2.0),
+            'consistency_interval': Config.BRAIN_CONFIG.get('consistency_interval', 300)
         }
         
         # آمار عملکرد
@@ -47,21 +102,512 @@ class Brain:
             'total_queries': 0,
             'successful_matches': 0,
             'avg_response_time': 0,
-            'cache_hits': 0
+            'cache_hits': 0,
+            'exact_hits': 0,
+            'coalesced': 0
         }
         
         self.stats_lock = threading.Lock()
         
-        # بارگذاری دانش
-        self.load_knowledge()
+        # تصویر فقط‌خواندنی دانش؛ خواننده‌ها بدون قفل از آن استفاده می‌کنند
+        self.snapshot = self.empty_snapshot()
+        self.knowledge_lock = threading.RLock()  # فقط برای نویسنده‌ها
+        self.rebuild_lock = threading.Lock()
+        self.rebuild_timer = None
+        self.matrix_lock = threading.Lock()  # یک بازسازی ماتریس در هر لحظه
+        self.refresh_lock = threading.Lock()  # یک تازه‌سازی پس‌زمینه در هر لحظه
+        
+        # اعلان تغییرات دانش بین کارگرها (Redis یا فایل نسخه)
+        self.sync = KnowledgeSync(
+            redis_client=self.redis if Config.BRAIN_CONFIG.get('knowledge_sync', True) else None,
+            version_file=Config.BRAIN_CONFIG.get('knowledge_version_file', 'logs/knowledge.version'),
+            poll_interval=Config.BRAIN_CONFIG.get('sync_interval', 1.0)
+        )
+        self.app = None
+        
+        # مقادیر خروجی /metrics
+        self.register_metrics()
+        
+        # بارگذاری دانش (در صورت خطا، بررسی هماهنگی بعداً دوباره تلاش می‌کند)
+        try:
+            self.load_knowledge()
+        except Exception as e:
+            print(f"⚠️ خطا در بارگذاری دانش: {e}")
+    
+    def register_metrics(self):
+        """ثبت مقادیری که /metrics هنگام خروجی گرفتن از مغز می‌خواند"""
+        def tiers():
+            stats = self.cache.get_stats()
+            return {
+                (('tier', 'l1'),): stats['l1_hits'],
+                (('tier', 'l2'),): stats['l2_hits'],
+                (('tier', 'miss'),): stats['misses']
+            }
+        
+        def ratios():
+            stats = self.cache.get_stats()
+            return {
+                (('tier', 'l1'),): stats['l1_hit_ratio'],
+                (('tier', 'l2'),): stats['l2_hit_ratio']
+            }
+        
+        def history():
+            stats = self.history_writer.get_stats()
+            return {(('state', k),): stats[k] for k in ('queued', 'flushed', 'dropped', 'failed')}
+        
+        metrics.register('knowledge_items', lambda: len(self.snapshot),
+                         help='Active knowledge items in memory.')
+        metrics.register('knowledge_version', lambda: self.sync.seen,
+                         help='Shared knowledge version seen by this worker.')
+        metrics.register('queries_total', lambda: self.stats['total_queries'], kind='counter',
+                         help='Questions received by Brain.think.')
+        metrics.register('exact_hits_total', lambda: self.stats['exact_hits'], kind='counter',
+                         help='Questions answered by the exact hash fast path.')
+        metrics.register('coalesced_total', lambda: self.stats['coalesced'], kind='counter',
+                         help='Requests that reused a concurrent identical computation.')
+        metrics.register('answer_cache_lookups_total', tiers, kind='counter',
+                         help='Answer cache lookups by the tier that served them.')
+        metrics.register('answer_cache_hit_ratio', ratios,
+                         help='Answer cache hit ratio per tier.')
+        metrics.register('history_rows_total', history, kind='counter',
+                         help='Chat history rows by write-behind state.')
+        metrics.register('history_pending', lambda: self.history_writer.queue.qsize(),
+                         help='Chat history rows waiting to be written.')
+        metrics.register('usage_pending', lambda: self.usage_counter.get_stats()['pending_rows'],
+                         help='Knowledge rows with unflushed usage deltas.')
+    
+    @property
+    def knowledge_items(self):
+        """فهرست دانش‌های فعال در حافظه"""
+        return list(self.snapshot.items.values())
+    
+    def empty_snapshot(self):
+        return KnowledgeSnapshot({}, {}, {}, InvertedIndex())
+    
+    def build_snapshot(self, records, watermark=None):
+        """ساخت کامل تصویر دانش (خارج از مسیر درخواست‌ها)
+        
+        watermark: بیشترین updated_at کل جدول (ردیف‌های غیرفعال‌شده هم)
+        """
+        features = dict(zip(
+            (record.id for record in records),
+            self.similarity_engine.build_features_many(record.question for record in records)
+        ))
+        index, lsh = self.build_candidate_index(records, features)
+        if watermark is None:
+            watermark = max(
+                (record.updated_at for record in records if record.updated_at), default=None
+            )
+        
+        return KnowledgeSnapshot(
+            items={record.id: record for record in records},
+            features=features,
+            hash_map=self.build_hash_map(records, features),
+            index=index,
+            lsh=lsh,
+            max_updated_at=watermark
+        )
     
     def load_knowledge(self):
-        """بارگذاری دانش از دیتابیس به حافظه"""
+        """بارگذاری دانش از دیتابیس به حافظه
+        
+        در صورت خطا تصویر فعلی دست نمی‌خورد و خطا بالا می‌رود تا همگام‌سازی یا
+        بررسی هماهنگی دوباره تلاش کند؛ یک خطای گذرای دیتابیس نباید حافظه را خالی کند.
+        """
+        # فقط ستون‌های لازم؛ هیچ شیء ORM در حافظه نمی‌ماند
+        rows = db.session.query(
+            Knowledge.id, Knowledge.question, Knowledge.updated_at
+        ).filter(Knowledge.is_active == True).all()
+        watermark = db.session.query(db.func.max(Knowledge.updated_at)).scalar()
+        snapshot = self.build_snapshot([KnowledgeRecord.from_row(row) for row in rows], watermark)
+        print(f"🧠 مغز آماده شد: {len(snapshot)} دانش بارگذاری شد")
+        
+        # انتشار با یک جایگزینی مرجع
+        with self.knowledge_lock:
+            self.snapshot = snapshot
+        
+        self.rebuild_matrices()
+        self.invalidate_answers()
+        self.last_consistency_check = time.time()
+    
+    def rebuild_matrices(self):
+        """بازسازی ساختارهای ماتریسی (tfidf، vector، sharded) از دانش در حافظه
+        
+        از نخ Timer و از load_knowledge صدا زده می‌شود؛ بازسازی‌ها پشت سر هم
+        اجرا می‌شوند تا نتیجه یک بازسازی قدیمی‌تر روی نتیجه تصویر جدیدتر ننشیند
+        (آخرین بازسازی، تازه‌ترین تصویر را می‌خواند).
+        """
+        with self.rebuild_lock:
+            self.rebuild_timer = None
+        
+        with self.matrix_lock:
+            mode = self.config['scoring_mode']
+            snapshot = self.snapshot
+            items = list(snapshot.items.values())
+            engine = self.similarity_engine
+            
+            # در حالت‌های دیگر فقط search_many از ماتریس TF-IDF استفاده می‌کند؛
+            # پس از اولین برازش آن، ماتریس همین‌جا (در پس‌زمینه) به‌روز می‌ماند
+            if mode == 'tfidf' or engine.tfidf_state is not None:
+                engine.fit_corpus(items)
+            if mode == 'vector':
+                engine.fit_vectors(items, self.stored_vectors(items))
+            if mode == 'sharded':
+                engine.fit_shards(items, snapshot.features, workers=self.config['parallel_workers'])
+            
+            engine.bump_generation()
+    
+    def schedule_matrix_rebuild(self):
+        """بازسازی تأخیری ماتریس‌ها تا چند تغییر پشت سر هم یک بار هزینه داشته باشند"""
+        if (self.config['scoring_mode'] not in self.MATRIX_MODES
+                and self.similarity_engine.tfidf_state is None):
+            return
+        
+        with self.rebuild_lock:
+            if self.rebuild_timer is not None:
+                self.rebuild_timer.cancel()
+            self.rebuild_timer = threading.Timer(
+                self.config['matrix_rebuild_delay'], self.rebuild_matrices
+            )
+            self.rebuild_timer.daemon = True
+            self.rebuild_timer.start()
+    
+    def hash_keys(self, item, features=None):
+        """کلیدهای نقشه هش یک دانش (سوال خام و پاک‌شده)"""
+        if features is not None:
+            raw = features.hash
+        else:
+            raw = self.text_processor.get_text_hash(item.question)
+        clean = self.text_processor.get_text_hash(self.text_processor.clean_text(item.question))
+        return raw, clean
+    
+    def add_to_memory(self, record):
+        """افزودن/جایگزینی یک رکورد در تصویر فعلی بدون بارگذاری مجدد"""
+        self.apply_changes(upserts=[record])
+    
+    def remember(self, item):
+        """افزودن دانش تازه commit‌شده به حافظه و اعلان آن به کارگرهای دیگر"""
+        if item.is_active is False:
+            return
+        self.add_to_memory(KnowledgeRecord.from_row(item))
+        self.sync.publish()
+    
+    def remove_from_memory(self, item_id, updated_at=None):
+        """حذف یک دانش از حافظه و همه ایندکس‌ها
+        
+        updated_at: زمان غیرفعال شدن ردیف؛ نشانگر تغییرات تا آن جلو می‌رود
+        """
+        self.apply_changes(removals=[(item_id, updated_at)])
+    
+    def apply_changes(self, upserts=(), removals=()):
+        """اعمال گروهی افزودن‌ها و حذف‌ها روی تصویر فعلی
+        
+        هر تغییر با انتساب‌های اتمیک تک‌کلیدی در همان تصویر اعمال می‌شود، پس
+        هزینه آن به اندازه دانش بستگی ندارد (هیچ دیکشنری کپی نمی‌شود). ترتیب
+        طوری است که خواننده هم‌زمان هر شناسه‌ای را که از ایندکس یا نقشه هش
+        بگیرد در items و features هم پیدا کند. نسل، کش جواب و بازسازی ماتریس‌ها
+        برای کل گروه فقط یک بار به‌روز می‌شوند.
+        removals: لیست (شناسه، updated_at)
+        """
+        upserts = list(upserts)
+        removals = list(removals)
+        if not upserts and not removals:
+            return
+        
+        all_features = self.similarity_engine.build_features_many(
+            record.question for record in upserts
+        )
+        changed = False
+        
+        with self.knowledge_lock:
+            snapshot = self.snapshot
+            for item_id, updated_at in removals:
+                self._advance_watermark(snapshot, updated_at)
+                record = snapshot.items.get(item_id)
+                if record is None:
+                    continue
+                self._unhash(snapshot, record)
+                snapshot.index.remove(item_id)
+                snapshot.items.pop(item_id, None)
+                snapshot.features.pop(item_id, None)
+                changed = True
+            
+            for record, features in zip(upserts, all_features):
+                old = snapshot.items.get(record.id)
+                if old is not None:
+                    self._unhash(snapshot, old)
+                
+                snapshot.features[record.id] = features
+                snapshot.items[record.id] = record
+                snapshot.index.add(record, tokens=features.tokens)
+                raw, clean = self.hash_keys(record, features)
+                snapshot.hash_map[raw] = record
+                snapshot.hash_map.setdefault(clean, record)
+                self._advance_watermark(snapshot, record.updated_at)
+                changed = True
+        
+        if not changed:
+            return
+        self.similarity_engine.bump_generation()
+        self.invalidate_answers()
+        self.schedule_matrix_rebuild()
+    
+    @staticmethod
+    def _advance_watermark(snapshot, updated_at):
+        """max_updated_at بیشترین تغییر دیده‌شده است (حذف‌ها هم) و هرگز عقب نمی‌رود"""
+        if updated_at and (snapshot.max_updated_at is None or updated_at > snapshot.max_updated_at):
+            snapshot.max_updated_at = updated_at
+    
+    def invalidate_answers(self):
+        """دانش عوض شده؛ هر جواب کش‌شده ممکن است دیگر بهترین جواب نباشد"""
+        self.cache.clear()
+    
+    def start_sync(self):
+        """شروع گوش دادن به تغییرات کارگرهای دیگر (با اپلیکیشن درخواست فعلی)"""
+        if self.sync.thread is not None:
+            return
+        
+        from flask import current_app, has_app_context
+        if self.app is None and has_app_context():
+            self.app = current_app._get_current_object()
+        if self.app is not None:
+            self.sync.start(self.on_remote_change)
+    
+    def on_remote_change(self, full=False):
+        """full: کارگر دیگری بارگذاری کامل اعلان کرده است (مثلاً یادگیری از فایل)"""
+        with self.refresh_lock, self.app.app_context():
+            try:
+                if full:
+                    self.load_knowledge()
+                else:
+                    self.refresh_changes()
+            finally:
+                db.session.remove()
+    
+    def refresh_changes(self):
+        """اعمال تغییرات دیتابیس از آخرین نسخه در حافظه (بدون بارگذاری کامل)
+        
+        ردیف‌هایی که updated_at آن‌ها از max_updated_at تصویر (با کمی هم‌پوشانی
+        برای اختلاف ساعت) جدیدتر است دوباره خوانده می‌شوند؛ اعمال دوباره بی‌اثر است.
+        همه تغییرات با یک apply_changes اعمال می‌شوند و اگر بیش از
+        sync_reload_threshold ردیف باشند بارگذاری کامل ارزان‌تر است.
+        """
+        since = self.snapshot.max_updated_at
+        if since is None:
+            self.load_knowledge()
+            return
+        
+        since -= timedelta(seconds=Config.BRAIN_CONFIG.get('sync_overlap', 2.0))
+        rows = db.session.query(
+            Knowledge.id, Knowledge.question, Knowledge.updated_at, Knowledge.is_active
+        ).filter(Knowledge.updated_at >= since).all()
+        
+        upserts = []
+        removals = []
+        for row in rows:
+            if not row.is_active:
+                removals.append((row.id, row.updated_at))
+                continue
+            
+            current = self.snapshot.items.get(row.id)
+            # هر تغییر جواب updated_at را هم جلو می‌برد
+            if current is not None and current.updated_at == row.updated_at \
+                    and current.question == row.question:
+                continue
+            upserts.append(KnowledgeRecord.from_row(row))
+        
+        if len(upserts) + len(removals) > Config.BRAIN_CONFIG.get('sync_reload_threshold', 500):
+            self.load_knowledge()
+            return
+        self.apply_changes(upserts, removals)
+    
+    def _unhash(self, snapshot, record):
+        for key in self.hash_keys(record, snapshot.features.get(record.id)):
+            if snapshot.hash_map.get(key) is record:
+                snapshot.hash_map.pop(key, None)
+    
+    def schedule_consistency_check(self):
+        """بررسی دوره‌ای هماهنگی در نخ پس‌زمینه؛ درخواست منتظر بارگذاری کامل نمی‌ماند"""
+        interval = self.config['consistency_interval']
+        if self.app is None or time.time() - self.last_consistency_check < interval:
+            return
+        
+        with self.rebuild_lock:
+            if time.time() - self.last_consistency_check < interval:
+                return
+            self.last_consistency_check = time.time()
+        
+        thread = threading.Thread(
+            target=self._run_consistency_check, name='consistency-check', daemon=True
+        )
+        thread.start()
+    
+    def _run_consistency_check(self):
+        with self.refresh_lock, self.app.app_context():
+            try:
+                self.check_consistency()
+            except Exception as e:
+                print(f"⚠️ خطا در بررسی هماهنگی دانش: {e}")
+            finally:
+                db.session.remove()
+    
+    def check_consistency(self):
+        """مقایسه حافظه با دیتابیس؛ در صورت اختلاف بارگذاری کامل
+        
+        تعداد دانش‌های فعال و بیشترین updated_at کل جدول مقایسه می‌شود؛ غیرفعال
+        کردن یک دانش updated_at آن را جلو می‌برد و همان در نشانگر تصویر هم ثبت می‌شود.
+        """
         try:
-            self.knowledge_items = Knowledge.query.filter_by(is_active=True).all()
-            print(f"🧠 مغز آماده شد: {len(self.knowledge_items)} دانش بارگذاری شد")
-        except:
-            self.knowledge_items = []
+            count = db.session.query(db.func.count(Knowledge.id))\
+                .filter(Knowledge.is_active == True).scalar()
+            max_updated_at = db.session.query(db.func.max(Knowledge.updated_at)).scalar()
+        except Exception:
+            return True
+        
+        snapshot = self.snapshot
+        if count == len(snapshot) and max_updated_at == snapshot.max_updated_at:
+            return True
+        
+        self.load_knowledge()
+        return False
+    
+    def stored_vectors(self, items):
+        """بردارهای ذخیره‌شده در question_vector برای ساخت ماتریس حالت vector
+        
+        blob‌ها با یک پرس‌وجو خوانده می‌شوند؛ فقط ردیف‌های قدیمی یا ناسازگار
+        (بعد متفاوت، قالب متنی پیش از LargeBinary) دوباره محاسبه می‌شوند.
+        """
+        from flask import has_app_context
+        
+        def query():
+            return dict(db.session.query(Knowledge.id, Knowledge.question_vector)
+                        .filter(Knowledge.is_active == True).all())
+        
+        blobs = {}
+        try:
+            if has_app_context():
+                blobs = query()
+            elif self.app is not None:
+                # بازسازی تأخیری در نخ Timer اجرا می‌شود
+                with self.app.app_context():
+                    try:
+                        blobs = query()
+                    finally:
+                        db.session.remove()
+        except Exception:
+            blobs = {}
+        
+        vectors = []
+        for item in items:
+            vector = self.text_processor.vector_from_blob(blobs.get(item.id))
+            if vector is None:
+                vector = self.text_processor.hash_vector(item.question)
+            vectors.append(vector)
+        return vectors
+    
+    def build_hash_map(self, items, features):
+        """نقشه هش -> دانش برای پاسخ O(1) به سوالات تکراری"""
+        hash_map = {}
+        for item in items:
+            raw, clean = self.hash_keys(item, features.get(item.id))
+            hash_map[raw] = item
+            
+            # سوال ورودی قبل از جستجو پاکسازی می‌شود، پس نسخه پاک‌شده هم ثبت می‌شود
+            hash_map.setdefault(clean, item)
+        return hash_map
+    
+    def build_candidate_index(self, items, features):
+        """ساخت ایندکس کاندیدها بر اساس تنظیمات (inverted، lsh یا both)
+        
+        خروجی: (ایندکس، ایندکس LSH یا None)
+        """
+        kind = self.config['candidate_index']
+        indexes = []
+        
+        if kind in ('inverted', 'both'):
+            indexes.append(InvertedIndex().build(items, features))
+        
+        lsh = None
+        if kind in ('lsh', 'both'):
+            lsh = MinHashLSH(
+                bands=self.config['lsh_bands'],
+                rows=self.config['lsh_rows']
+            ).build(items)
+            indexes.append(lsh)
+        
+        if not indexes:
+            return InvertedIndex().build(items, features), lsh
+        if len(indexes) == 1:
+            return indexes[0], lsh
+        return UnionIndex(*indexes), lsh
+    
+    def lsh_report(self, questions=None, bands=None, rows=None, sample_size=100):
+        """گزارش بازیابی (recall) در برابر تأخیر برای تنظیم bands/rows
+        
+        recall: سهم تطابق‌های جستجوی کامل که در کاندیدهای LSH هم بوده‌اند
+        """
+        snapshot = self.snapshot
+        items = list(snapshot.items.values())
+        if not items:
+            return {'queries': 0}
+        
+        bands = bands or self.config['lsh_bands']
+        rows = rows or self.config['lsh_rows']
+        
+        lsh = snapshot.lsh
+        if lsh is None or (lsh.bands, lsh.rows) != (bands, rows):
+            lsh = MinHashLSH(bands=bands, rows=rows).build(items)
+        
+        # پیش‌فرض: سوالات اخیر کاربران
+        if questions is None:
+            history = ChatHistory.query.order_by(ChatHistory.created_at.desc())\
+                .limit(sample_size).all()
+            questions = [h.question for h in history if h.question]
+        questions = list(questions)[:sample_size]
+        
+        threshold = self.config['similarity_threshold']
+        limit = self.config['candidate_limit']
+        engine = self.similarity_engine
+        
+        found = 0
+        recalled = 0
+        candidates_total = 0
+        lsh_time = 0.0
+        full_time = 0.0
+        
+        for question in questions:
+            question = self.text_processor.clean_text(question)
+            if not question:
+                continue
+            
+            t0 = time.time()
+            candidate_ids = {item.id for item in lsh.candidates(question, limit=limit)}
+            lsh_time += time.time() - t0
+            
+            t0 = time.time()
+            exhaustive = engine.combined_match(
+                question, items, threshold,
+                features=snapshot.features,
+                top_k=len(items)
+            )
+            full_time += time.time() - t0
+            
+            match_ids = {m['item'].id for m in exhaustive['matches']}
+            found += len(match_ids)
+            recalled += len(match_ids & candidate_ids)
+            candidates_total += len(candidate_ids)
+        
+        count = len(questions) or 1
+        return {
+            'bands': bands,
+            'rows': rows,
+            'estimated_threshold': round(lsh.threshold, 3),
+            'queries': len(questions),
+            'recall': recalled / found if found else 1.0,
+            'avg_candidates': candidates_total / count,
+            'lsh_ms': lsh_time * 1000 / count,
+            'full_scan_ms': full_time * 1000 / count
+        }
     
     def think(self, question, user_id=None):
         """فکر کردن به سوال و پیدا کردن جواب"""
@@ -70,8 +616,13 @@ class Brain:
         with self.stats_lock:
             self.stats['total_queries'] += 1
         
+        # بررسی دوره‌ای هماهنگی حافظه با دیتابیس (در پس‌زمینه) و تغییرات کارگرهای دیگر
+        self.start_sync()
+        self.schedule_consistency_check()
+        
         # پاکسازی سوال
-        clean_question = self.text_processor.clean_text(question)
+        with metrics.timer('normalize'):
+            clean_question = self.text_processor.clean_text(question)
         
         if not clean_question:
             return {
@@ -81,16 +632,25 @@ class Brain:
             }
         
         # بررسی کش
-        cache_key = f"answer:{hashlib.md5(clean_question.encode()).hexdigest()}"
-        cached = self.cache.get(cache_key)
+        # نسل دانش (نسخه مشترک بین کارگرها) بخشی از کلید است
+        cache_key = hashlib.md5(clean_question.encode()).hexdigest()
+        generation = self.sync.seen
+        with metrics.timer('cache_lookup'):
+            cached = self.cache.get(cache_key, generation=generation)
         if cached:
             with self.stats_lock:
                 self.stats['cache_hits'] += 1
-            cached['from_cache'] = True
-            return cached
+            metrics.observe('request', time.time() - start_time)
+            return {**cached, 'from_cache': True}
         
-        # جستجو در دانش
-        result = self.search_in_brain(clean_question)
+        # جستجو در دانش؛ درخواست‌های هم‌زمان با همین سوال منتظر همین محاسبه می‌مانند
+        (result, answer), coalesced = self.inflight.do(
+            f"{generation}:{cache_key}",
+            lambda: self.answer_question(clean_question, question, cache_key, generation),
+            timeout=Config.BRAIN_CONFIG.get('coalesce_timeout', 5.0)
+        )
+        if coalesced and answer.get('answer_id'):
+            self.usage_counter.record(answer['answer_id'], success=True)
         
         # محاسبه زمان پاسخ
         response_time = time.time() - start_time
@@ -102,22 +662,29 @@ class Brain:
             )
             if result['best_match']:
                 self.stats['successful_matches'] += 1
-        
-        # آماده‌سازی پاسخ
-        answer = self.prepare_answer(result, question)
+            if coalesced:
+                self.stats['coalesced'] += 1
         
         # ذخیره در تاریخچه
         self.save_to_history(question, answer, result, user_id, response_time)
+        metrics.observe('request', response_time)
         
-        # ذخیره در کش
-        self.cache.set(cache_key, answer, timeout=300)
-        
-        return answer
+        return {**answer, 'coalesced': True} if coalesced else answer
+    
+    def answer_question(self, clean_question, question, cache_key, generation):
+        """جستجو، آماده‌سازی و کش کردن جواب (یک بار برای هر گروه درخواست هم‌زمان)"""
+        result = self.search_in_brain(clean_question)
+        answer = self.prepare_answer(result, question)
+        self.cache.set(cache_key, answer, generation=generation)
+        return result, answer
     
     def search_in_brain(self, question):
         """جستجو در مغز با الگوریتم پیشرفته"""
         
-        if not self.knowledge_items:
+        # یک بار خواندن تصویر؛ همه ساختارها از همین نسخه استفاده می‌شوند
+        snapshot = self.snapshot
+        
+        if not snapshot.items:
             return {
                 'best_match': None,
                 'best_score': 0,
@@ -125,15 +692,81 @@ class Brain:
                 'type': 'no_knowledge'
             }
         
+        # مسیر سریع: تطابق دقیق با هش سوال
+        exact = snapshot.hash_map.get(self.text_processor.get_text_hash(question))
+        if exact is not None:
+            with self.stats_lock:
+                self.stats['exact_hits'] += 1
+            return {
+                'best_match': exact,
+                'best_score': 1.0,
+                'matches': [{'item': exact, 'score': 1.0, 'details': {'exact_match': 1.0}}],
+                'count': 1,
+                'type': 'exact'
+            }
+        
         # پیدا کردن بهترین تطابق
+        # نمای دیکشنری بدون کپی؛ فقط وقتی ایندکس کاندیدی نداشت پیمایش می‌شود
         matches = self.similarity_engine.find_best_match(
             question, 
-            self.knowledge_items,
-            threshold=self.config['similarity_threshold']
+            snapshot.items.values(),
+            threshold=self.config['similarity_threshold'],
+            index=snapshot.index,
+            candidate_limit=self.config['candidate_limit'],
+            features=snapshot.features,
+            mode=self.config['scoring_mode'],
+            top_k=self.config['max_results']
         )
         
+        # ماتریس‌ها با تأخیر بازسازی می‌شوند؛ دانش‌های فراموش‌شده حذف شوند
+        if self.config['scoring_mode'] in self.MATRIX_MODES:
+            matches = self.drop_forgotten(matches, snapshot.items)
+        
         return matches
     
+    def drop_forgotten(self, result, live):
+        """حذف دانش‌های غیرفعال‌شده از نتیجه و جایگزینی رکوردهای قدیمی با نسخه فعلی"""
+        kept = []
+        for m in result['matches']:
+            item = live.get(m['item'].id)
+            if item is not None:
+                kept.append({**m, 'item': item})
+        if len(kept) == len(result['matches']) and all(
+            m['item'] is old['item'] for m, old in zip(kept, result['matches'])
+        ):
+            return result
+        
+        return {
+            **result,
+            'best_match': kept[0]['item'] if kept else None,
+            'best_score': kept[0]['score'] if kept else 0,
+            'matches': kept
+        }
+    
+    def search_many(self, questions):
+        """جستجوی دسته‌ای (بازپخش تاریخچه، ارزیابی، گرم کردن کش)
+        
+        کاندیدها از ماتریس TF-IDF می‌آیند. فقط اولین فراخوانی (در حالت‌های غیر
+        tfidf) ماتریس را هم‌زمان برازش می‌کند؛ پس از آن تغییرات دانش با بازسازی
+        تأخیری در پس‌زمینه اعمال می‌شوند و تا آن موقع دانش‌های فراموش‌شده از
+        نتیجه حذف می‌شوند.
+        """
+        questions = [self.text_processor.clean_text(q) for q in questions]
+        snapshot = self.snapshot
+        
+        batch = self.similarity_engine.find_best_matches(
+            questions,
+            snapshot.items.values(),
+            threshold=self.config['similarity_threshold'],
+            features=snapshot.features,
+            mode=self.config['scoring_mode'],
+            top_k=self.config['max_results'],
+            candidate_limit=self.config['candidate_limit'],
+            batch_size=Config.BRAIN_CONFIG.get('batch_size', 1000)
+        )
+        batch['results'] = [self.drop_forgotten(r, snapshot.items) for r in batch['results']]
+        return batch
+    
     def prepare_answer(self, result, original_question):
         """آماده‌سازی پاسخ برای کاربر"""
         
@@ -149,12 +782,14 @@ class Brain:
         best = result['best_match']
         score = result['best_score']
         
-        # به‌روزرسانی آمار استفاده
-        best.update_usage(success=True)
-        db.session.commit()
-        
         # آماده‌سازی پاسخ
-        answer_text = best.answer
+        answer_text = self.answer_text(best)
+        if answer_text is None:
+            # دانش هم‌زمان حذف شده است
+            return self.prepare_answer({**result, 'best_match': None}, original_question)
+        
+        # به‌روزرسانی آمار استفاده (تجمیعی، بدون تراکنش در مسیر درخواست)
+        self.usage_counter.record(best.id, success=True)
         
         # اگر امتیاز پایین است، اخطار بده
         if score < 0.7:
@@ -172,36 +807,42 @@ class Brain:
         return {
             'answer': answer_text,
             'confidence': score,
-            'type': 'knowledge',
+            'type': 'exact' if result.get('type') == 'exact' else 'knowledge',
             'matches_count': result['count'],
             'suggestions': suggestions,
             'answer_id': best.id
         }
     
+    def answer_text(self, record):
+        """متن جواب یک دانش (از دیتابیس، با کش به ازای شناسه و نسخه رکورد)"""
+        key = f"{record.id}:{record.updated_at}"
+        text = self.answer_texts.get(key)
+        if text is None:
+            text = db.session.query(Knowledge.answer).filter(
+                Knowledge.id == record.id, Knowledge.is_active == True
+            ).scalar()
+            if text is not None:
+                self.answer_texts.set(key, text)
+        return text
+    
     def save_to_history(self, question, answer, result, user_id, response_time):
-        """ذخیره در تاریخچه"""
-        try:
-            from models.database import ChatHistory
-            
-            history = ChatHistory(
-                user_id=user_id or 'anonymous',
-                session_id='temp',
-                question=question[:500],
-                question_length=len(question),
-                answer=answer['answer'][:500],
-                answer_id=result['best_match'].id if result['best_match'] else None,
-                answer_type=answer['type'],
-                confidence=answer.get('confidence', 0),
-                response_time=response_time,
-                created_at=datetime.now()
-            )
-            db.session.add(history)
-            db.session.commit()
-        except:
-            pass
+        """ثبت در صف تاریخچه (ذخیره دسته‌ای در پس‌زمینه)"""
+        self.history_writer.put({
+            'user_id': user_id or 'anonymous',
+            'session_id': 'temp',
+            'question': question[:500],
+            'question_length': len(question),
+            'answer': answer['answer'][:500],
+            'answer_id': result['best_match'].id if result['best_match'] else None,
+            'answer_type': answer['type'],
+            'confidence': answer.get('confidence', 0),
+            'response_time': response_time,
+            'created_at': datetime.now()
+        })
     
     def learn(self, question, answer, source='manual'):
         """یادگیری مستقیم"""
+        self.start_sync()
         try:
             # بررسی تکراری نبودن
             existing = Knowledge.query.filter_by(
@@ -211,12 +852,14 @@ class Brain:
             if existing:
                 # به‌روزرسانی دانش قبلی
                 existing.answer = answer
+                existing.question_vector = self.text_processor.create_vector(question)
                 existing.version += 1
                 existing.updated_at = datetime.now()
-                db.session.commit()
+                with metrics.timer('db_write'):
+                    db.session.commit()
                 
-                # به‌روزرسانی حافظه
-                self.load_knowledge()
+                # به‌روزرسانی حافظه (فقط همین دانش)
+                self.remember(existing)
                 
                 return {'success': True, 'message': '✅ دانش به‌روزرسانی شد', 'updated': True}
             
@@ -226,6 +869,7 @@ class Brain:
             knowledge = Knowledge(
                 question=question,
                 question_hash=self.text_processor.get_text_hash(question),
+                question_vector=self.text_processor.create_vector(question),
                 question_length=len(question),
                 answer=answer,
                 answer_length=len(answer),
@@ -238,21 +882,114 @@ class Brain:
             )
             
             db.session.add(knowledge)
-            db.session.commit()
+            with metrics.timer('db_write'):
+                db.session.commit()
             
-            # به‌روزرسانی حافظه
-            self.load_knowledge()
+            # به‌روزرسانی حافظه (فقط همین دانش)
+            self.remember(knowledge)
             
             return {'success': True, 'message': '✅ یاد گرفتم!', 'id': knowledge.id}
             
         except Exception as e:
             return {'success': False, 'message': f'❌ خطا: {str(e)}'}
     
+    def learn_many(self, pairs, source='manual'):
+        """یادگیری دسته‌ای: یک پرس‌وجوی IN، درج/به‌روزرسانی گروهی و یک بار تازه‌سازی حافظه
+        
+        pairs: لیست دیکشنری‌های {'question', 'answer'}. خروجی (learned, errors)
+        """
+        batch_size = max(1, Config.BRAIN_CONFIG.get('batch_size', 1000))
+        
+        # حذف تکراری‌های داخل فایل (آخرین جواب برنده است)
+        unique = {}
+        errors = 0
+        for pair in pairs:
+            question = pair.get('question')
+            answer = pair.get('answer')
+            if not question or not answer:
+                errors += 1
+                continue
+            unique[self.text_processor.get_text_hash(question)] = (question, answer)
+        
+        if not unique:
+            return 0, errors
+        
+        # دانش‌های موجود با پرس‌وجوی IN (به اندازه batch_size برای محدودیت پارامترها)
+        hashes = list(unique)
+        existing = {}
+        for i in range(0, len(hashes), batch_size):
+            rows = db.session.query(Knowledge.id, Knowledge.question_hash, Knowledge.version)\
+                .filter(Knowledge.question_hash.in_(hashes[i:i + batch_size])).all()
+            existing.update((row.question_hash, row) for row in rows)
+        
+        new_hashes = [h for h in hashes if h not in existing]
+        
+        # کلمات کلیدی فقط برای دانش‌های جدید، در استخر پردازه
+        all_keywords = self.text_processor.iter_batch(
+            (unique[h][0] + ' ' + unique[h][1] for h in new_hashes),
+            'extract_keywords'
+        )
+        
+        now = datetime.now()
+        updates = []
+        for question_hash, row in existing.items():
+            question, answer = unique[question_hash]
+            updates.append({
+                'id': row.id,
+                'answer': answer,
+                'answer_length': len(answer),
+                'question_vector': self.text_processor.create_vector(question),
+                'version': (row.version or 1) + 1,
+                'updated_at': now
+            })
+        
+        inserts = []
+        for question_hash, keywords in zip(new_hashes, all_keywords):
+            question, answer = unique[question_hash]
+            inserts.append({
+                'question': question,
+                'question_hash': question_hash,
+                'question_vector': self.text_processor.create_vector(question),
+                'question_length': len(question),
+                'answer': answer,
+                'answer_length': len(answer),
+                'keywords': json.dumps(keywords),
+                'important_words': json.dumps(keywords[:5]),
+                'source_file': source,
+                'confidence': 1.0,
+                'quality_score': 1.0,
+                'usage_count': 0,
+                'success_count': 0,
+                'fail_count': 0,
+                'version': 1,
+                'is_active': True,
+                'created_at': now,
+                'updated_at': now
+            })
+        
+        # همه دسته‌ها در یک تراکنش
+        try:
+            with metrics.timer('db_write'):
+                for i in range(0, len(updates), batch_size):
+                    db.session.bulk_update_mappings(Knowledge, updates[i:i + batch_size])
+                for i in range(0, len(inserts), batch_size):
+                    db.session.bulk_insert_mappings(Knowledge, inserts[i:i + batch_size])
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        # یک بار تازه‌سازی حافظه برای کل فایل؛ کارگرهای دیگر در هر حال خبردار شوند
+        try:
+            self.load_knowledge()
+        finally:
+            self.sync.publish(reload=True)
+        
+        return len(updates) + len(inserts), errors
+    
     def learn_from_file(self, filepath, filename):
         """یادگیری از فایل"""
         start_time = time.time()
-        learned = 0
-        errors = 0
         
         try:
             from .learner import FileLearner
@@ -261,17 +998,17 @@ class Brain:
             # استخراج جواب‌ها از فایل
             answers = learner.extract_answers(filepath, filename)
             
-            # یادگیری هر جواب
-            for answer_data in answers:
-                result = self.learn(
-                    question=answer_data['question'],
-                    answer=answer_data['answer'],
-                    source=f'file:{filename}'
-                )
-                if result['success']:
-                    learned += 1
-                else:
-                    errors += 1
+            # یادگیری دسته‌ای همه جواب‌ها
+            learned, errors = self.learn_many(answers, source=f'file:{filename}')
+            
+            processing_time = time.time() - start_time
+            pairs_per_second = len(answers) / processing_time if processing_time > 0 else 0.0
+            
+            metrics.inc('ingest_files_total', help='Files ingested through learn_from_file.')
+            metrics.inc('ingest_pairs_total', len(answers), help='Question/answer pairs extracted from files.')
+            metrics.inc('ingest_learned_total', learned, help='Pairs inserted or updated from files.')
+            metrics.inc('ingest_errors_total', errors, help='Extracted pairs rejected during ingestion.')
+            metrics.inc('ingest_seconds_total', processing_time, help='Time spent ingesting files in seconds.')
             
             # ذخیره تاریخچه
             from models.database import FileLearningHistory
@@ -283,7 +1020,7 @@ class Brain:
                 extracted_count=learned + errors,
                 learned_count=learned,
                 status='success' if errors == 0 else 'partial',
-                processing_time=time.time() - start_time
+                processing_time=processing_time
             )
             db.session.add(history)
             db.session.commit()
@@ -292,7 +1029,9 @@ class Brain:
                 'success': True,
                 'learned': learned,
                 'errors': errors,
-                'message': f'✅ {learned} مورد یادگیری موفق'
+                'processing_time': processing_time,
+                'pairs_per_second': pairs_per_second,
+                'message': f'✅ {learned} مورد یادگیری موفق ({pairs_per_second:.0f} مورد در ثانیه)'
             }
             
         except Exception as e:
@@ -304,9 +1043,16 @@ class Brain:
     def get_stats(self):
         """دریافت آمار مغز"""
         return {
-            'total_knowledge': len(self.knowledge_items),
+            'total_knowledge': len(self.snapshot),
             **self.stats,
             'cache_size': self.cache.size(),
+            'answer_cache': self.cache.get_stats(),
+            'pruning': self.similarity_engine.get_prune_stats(),
+            'text_cache': self.text_processor.get_cache_stats(),
+            'history': self.history_writer.get_stats(),
+            'usage': self.usage_counter.get_stats(),
+            'latency_ms': metrics.get_stats(),
+            'sync': {'backend': self.sync.backend_name, 'version': self.sync.seen},
             'brain_status': 'active'
         }
     
@@ -317,7 +1063,8 @@ class Brain:
             if knowledge:
                 knowledge.is_active = False
                 db.session.commit()
-                self.load_knowledge()
+                self.remove_from_memory(knowledge_id, knowledge.updated_at)
+                self.sync.publish()
                 return True
         except:
             pass
@@ -0,0 +1,159 @@
+import time
+from difflib import SequenceMatcher
+import numpy as np
+
+# حداکثر طول الگو برای نسخه برداری NumPy (یک کلمه ۶۴ بیتی)
+WORD_BITS = 64
+
+
+def char_masks(text):
+    """بیت‌ماسک هر کاراکتر در متن (Peq در الگوریتم Myers)"""
+    masks = {}
+    bit = 1
+    for ch in text:
+        masks[ch] = masks.get(ch, 0) | bit
+        bit <<= 1
+    return masks
+
+
+def myers_distance(masks, m, text):
+    """فاصله ویرایشی (Levenshtein) با الگوریتم بیت-موازی Myers/Hyyrö
+
+    masks و m مربوط به الگو (سوال ذخیره‌شده) هستند و text متن پرسش است.
+    اعداد صحیح پایتون طول دلخواه دارند، پس الگوی بلند هم یک "کلمه" است.
+    """
+    if m == 0:
+        return len(text)
+
+    full = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv = full
+    mv = 0
+    score = m
+
+    for ch in text:
+        eq = masks.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+
+    return score
+
+
+def edit_similarity(masks, m, text):
+    """شباهت نرمال‌شده: ۱ - فاصله / طول بلندتر"""
+    longest = max(m, len(text))
+    if longest == 0:
+        return 1.0
+    return 1.0 - myers_distance(masks, m, text) / longest
+
+
+def batch_edit_similarity(text, masks_list, lengths):
+    """شباهت ویرایشی یک متن با چند الگو به صورت برداری (NumPy)
+
+    الگوهای تا ۶۴ کاراکتر در یک آرایه uint64 هم‌زمان پردازش می‌شوند و
+    الگوهای بلندتر با نسخه اعداد صحیح پایتون محاسبه می‌شوند.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n = len(text)
+    result = np.empty(len(lengths), dtype=np.float64)
+
+    short = np.flatnonzero((lengths > 0) & (lengths <= WORD_BITS))
+    for i in np.flatnonzero((lengths == 0) | (lengths > WORD_BITS)):
+        result[i] = edit_similarity(masks_list[i], int(lengths[i]), text)
+
+    if len(short) == 0:
+        return result
+
+    m = lengths[short].astype(np.uint64)
+    one = np.uint64(1)
+    full = np.where(m == WORD_BITS, np.uint64(0xFFFFFFFFFFFFFFFF), (one << m) - one)
+    high = one << (m - one)
+
+    # جدول Eq فقط برای کاراکترهای موجود در متن پرسش
+    eq_table = {
+        ch: np.array([masks_list[i].get(ch, 0) for i in short], dtype=np.uint64)
+        for ch in set(text)
+    }
+
+    pv = full.copy()
+    mv = np.zeros(len(short), dtype=np.uint64)
+    score = m.astype(np.int64)
+
+    for ch in text:
+        eq = eq_table[ch]
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+
+        up = (ph & high) != 0
+        down = ~up & ((mh & high) != 0)
+        score += up
+        score -= down
+
+        ph = ((ph << one) | one) & full
+        mh = (mh << one) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+
+    longest = np.maximum(lengths[short], n)
+    result[short] = 1.0 - score / longest
+    return result
+
+
+def benchmark(pairs, repeat=3):
+    """مقایسه هزینه هر جفت: difflib در برابر Myers (تکی و برداری)
+
+    pairs: لیست (سوال ذخیره‌شده، پرسش). خروجی بر حسب میکروثانیه برای هر جفت.
+    """
+    pairs = [(a.lower(), b.lower()) for a, b in pairs]
+    if not pairs:
+        return {}
+
+    prepared = [(char_masks(a), len(a), b) for a, b in pairs]
+
+    def timed(func):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best * 1e6 / len(pairs)
+
+    def run_difflib():
+        for a, b in pairs:
+            SequenceMatcher(None, a, b).ratio()
+
+    def run_myers():
+        for masks, m, b in prepared:
+            edit_similarity(masks, m, b)
+
+    # حالت برداری: یک پرسش در برابر همه الگوها
+    by_query = {}
+    for masks, m, b in prepared:
+        by_query.setdefault(b, ([], []))
+        by_query[b][0].append(masks)
+        by_query[b][1].append(m)
+
+    def run_numpy():
+        for b, (masks_list, lengths) in by_query.items():
+            batch_edit_similarity(b, masks_list, lengths)
+
+    return {
+        'pairs': len(pairs),
+        'difflib_us': timed(run_difflib),
+        'myers_us': timed(run_myers),
+        'myers_numpy_us': timed(run_numpy)
+    }
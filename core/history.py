@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+from collections import Counter
+from utils.metrics import metrics
+from .background import BackgroundFlusher
+
+# سیاست‌های صف پر
+DROP_NEW = 'drop_new'        # ردیف جدید دور ریخته می‌شود (درخواست هرگز منتظر نمی‌ماند)
+DROP_OLDEST = 'drop_oldest'  # قدیمی‌ترین ردیف صف جای خود را به ردیف جدید می‌دهد
+BLOCK = 'block'              # درخواست حداکثر block_timeout ثانیه منتظر جا می‌ماند
+
+
+class WriteBehindWriter(BackgroundFlusher):
+    """نوشتن تأخیری و دسته‌ای ردیف‌ها در دیتابیس خارج از مسیر درخواست
+
+    ردیف‌ها (دیکشنری ستون -> مقدار) در صفی محدود قرار می‌گیرند و یک نخ
+    پس‌زمینه هر batch_size ردیف یا هر flush_interval ثانیه آن‌ها را با یک
+    bulk insert و یک commit ذخیره می‌کند.
+    """
+
+    thread_name = 'write-behind'
+
+    def __init__(self, model, batch_size=500, flush_interval=1.0, max_queue=10000,
+                 drop_policy=DROP_NEW, block_timeout=0.05):
+        super().__init__()
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def put(self, row):
+        """افزودن یک ردیف به صف؛ False اگر طبق سیاست صف پر دور ریخته شد"""
+        if self.stopping.is_set():
+            self._count('dropped')
+            return False
+
+        self._ensure_started()
+
+        try:
+            if self.drop_policy == BLOCK:
+                self.queue.put(row, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(row)
+        except queue.Full:
+            if self.drop_policy != DROP_OLDEST:
+                self._count('dropped')
+                return False
+            try:
+                self.queue.get_nowait()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                self._count('dropped')
+                return False
+
+        self._count('queued')
+        return True
+
+    def _run(self):
+        while not self.stopping.is_set():
+            if self.app is None:
+                # ردیف‌ها در صف می‌مانند تا اپلیکیشن در فراخوانی بعدی گرفته شود
+                self.stopping.wait(self.flush_interval)
+                continue
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self):
+        """جمع‌آوری ردیف‌ها تا رسیدن به batch_size یا پایان flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.stopping.is_set():
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _flush(self, batch):
+        """ذخیره یک دسته با یک bulk insert و یک commit"""
+        from models.database import db
+
+        if self.app is None:
+            self._count('failed', len(batch))
+            return
+
+        with self.app.app_context():
+            try:
+                with metrics.timer('db_write'):
+                    db.session.bulk_insert_mappings(self.model, batch)
+                    db.session.commit()
+                self._count('flushed', len(batch))
+                self._count('batches')
+            except Exception as e:
+                db.session.rollback()
+                self._count('failed', len(batch))
+                print(f"⚠️ خطا در ذخیره {len(batch)} ردیف {self.model.__tablename__}: {e}")
+            finally:
+                db.session.remove()
+
+    def flush(self):
+        """ذخیره فوری همه ردیف‌های صف (در نخ فراخواننده)"""
+        batch = self._drain()
+        for i in range(0, len(batch), self.batch_size):
+            self._flush(batch[i:i + self.batch_size])
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        for key in ('queued', 'flushed', 'dropped', 'failed', 'batches'):
+            stats.setdefault(key, 0)
+        stats['pending'] = self.queue.qsize()
+        return stats
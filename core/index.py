@@ -0,0 +1,260 @@
+import heapq
+import math
+import zlib
+from collections import defaultdict
+import numpy as np
+from .text_processor import TextProcessor
+
+
+class InvertedIndex:
+    """ایندکس معکوس توکن/ریشه برای انتخاب سریع کاندیدها
+
+    نویسنده‌ها (پشت قفل Brain) فقط کلیدهای همان دانش را در جا تغییر می‌دهند و
+    خواننده‌ها قفل نمی‌گیرند: هر لیست ارسال با یک list() اتمیک خوانده می‌شود و
+    شناسه‌ای که هم‌زمان حذف شده نادیده گرفته می‌شود.
+    """
+
+    def __init__(self, max_df_ratio=0.5):
+        self.text_processor = TextProcessor()
+        self.max_df_ratio = max_df_ratio  # ترم‌های خیلی رایج مثل کلمه توقف رفتار می‌کنند
+
+        self.postings = {}                 # ترم -> شناسه دانش‌ها
+        self.items = {}                    # شناسه -> دانش
+        self.item_terms = {}               # شناسه -> ترم‌ها (برای حذف)
+
+    def __len__(self):
+        return len(self.items)
+
+    def terms(self, text, tokens=None):
+        """استخراج ترم‌های قابل ایندکس (توکن و ریشه؛ tokens از قبل یکسان‌سازی شده)"""
+        if tokens is None:
+            tokens = self.text_processor.canonicalize(self.text_processor.tokenize(text))
+
+        terms = set()
+        for token in tokens:
+            token = token.lower()
+            terms.add(token)
+            terms.add(self.text_processor.stem_word(token))
+        return terms
+
+    def build(self, items, features=None):
+        """ساخت کامل ایندکس از روی دانش‌ها"""
+        self.postings = {}
+        self.items = {}
+        self.item_terms = {}
+        features = features or {}
+        for item in items:
+            item_features = features.get(item.id)
+            self.add(item, tokens=item_features.tokens if item_features else None)
+        return self
+
+    def add(self, item, tokens=None):
+        """افزودن یک دانش به ایندکس"""
+        terms = self.terms(item.question, tokens)
+
+        if item.id in self.items:
+            self.remove(item.id)
+
+        # اول رکورد، بعد لیست‌های ارسال تا هر شناسه پیداشده قابل خواندن باشد
+        self.items[item.id] = item
+        self.item_terms[item.id] = terms
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                self.postings[term] = {item.id}
+            else:
+                posting.add(item.id)
+
+    def remove(self, item_id):
+        """حذف یک دانش از ایندکس"""
+        for term in self.item_terms.pop(item_id, ()):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.discard(item_id)
+            if not posting:
+                self.postings.pop(term, None)
+        self.items.pop(item_id, None)
+
+    def candidates(self, question, limit=200):
+        """انتخاب کاندیدها با اجتماع لیست‌های ارسال و امتیاز IDF"""
+        return self._candidates(self.terms(question), limit)
+
+    def _candidates(self, terms, limit):
+        total = len(self.items)
+        if not total:
+            return []
+
+        # list() اتمیک است؛ تغییر هم‌زمان یک مجموعه حین پیمایش خطا نمی‌دهد
+        postings = [list(p) for p in map(self.postings.get, terms) if p]
+        if not postings:
+            return []
+
+        # ترم‌های نادر اول؛ ترم‌های خیلی رایج فقط وقتی که چیز دیگری نباشد
+        postings.sort(key=len)
+        max_df = max(1, int(total * self.max_df_ratio))
+        selective = [p for p in postings if len(p) <= max_df]
+        if selective:
+            postings = selective
+
+        hits = defaultdict(float)
+        for posting in postings:
+            idf = 1.0 + math.log(total / len(posting))
+            for item_id in posting:
+                hits[item_id] += idf
+
+        if len(hits) > limit:
+            top_ids = heapq.nlargest(limit, hits, key=hits.__getitem__)
+        else:
+            top_ids = list(hits)
+
+        items = self.items
+        return [items[i] for i in top_ids if i in items]
+
+
+class MinHashLSH:
+    """ایندکس تقریبی MinHash با سطل‌های LSH باندی برای سوالات تقریباً تکراری
+
+    احتمال کاندید شدن دو متن با شباهت Jaccard برابر s:  1 - (1 - s^rows)^bands
+    مثل InvertedIndex، تغییرات تک‌کلیدی در جا هستند و خواننده‌ها قفل نمی‌گیرند.
+    """
+
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, bands=16, rows=4, shingle_size=3, seed=1):
+        self.text_processor = TextProcessor()
+        self.bands = bands
+        self.rows = rows
+        self.shingle_size = shingle_size
+
+        # ضرایب درهم‌سازی جهانی (a*x + b) mod p برای هر جایگشت
+        num_perm = bands * rows
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, self.PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, self.PRIME, size=num_perm).astype(np.uint64)
+
+        self.buckets = {}                 # (باند، کلید) -> شناسه دانش‌ها
+        self.items = {}                   # شناسه -> دانش
+        self.item_keys = {}               # شناسه -> کلیدهای سطل (برای حذف)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def threshold(self):
+        """شباهت تقریبی که احتمال کاندید شدن در آن ۵۰٪ است"""
+        return (1 / self.bands) ** (1 / self.rows)
+
+    def shingles(self, text):
+        """شینگل‌های کاراکتری و کلمه‌ای متن نرمال‌شده"""
+        text = ' '.join(self.text_processor.normalize_persian(text.lower()).split())
+        shingles = set(text.split())
+        k = self.shingle_size
+        for i in range(max(1, len(text) - k + 1)):
+            shingles.add(text[i:i + k])
+        return shingles
+
+    def signature(self, text):
+        """امضای MinHash متن (آرایه‌ای به طول bands * rows)"""
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode()) % self.PRIME for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        return ((np.outer(hashes, self.a) + self.b) % self.PRIME).min(axis=0)
+
+    def band_keys(self, signature):
+        """کلید سطل هر باند"""
+        rows = self.rows
+        return [
+            (band, signature[band * rows:(band + 1) * rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def build(self, items, features=None):
+        """ساخت کامل ایندکس از روی دانش‌ها"""
+        self.buckets = {}
+        self.items = {}
+        self.item_keys = {}
+        for item in items:
+            self.add(item)
+        return self
+
+    def add(self, item, tokens=None):
+        """افزودن یک دانش به ایندکس"""
+        signature = self.signature(item.question)
+        keys = self.band_keys(signature) if signature is not None else []
+
+        if item.id in self.items:
+            self.remove(item.id)
+
+        self.items[item.id] = item
+        self.item_keys[item.id] = keys
+        for key in keys:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = {item.id}
+            else:
+                bucket.add(item.id)
+
+    def remove(self, item_id):
+        """حذف یک دانش از ایندکس"""
+        for key in self.item_keys.pop(item_id, ()):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                continue
+            bucket.discard(item_id)
+            if not bucket:
+                self.buckets.pop(key, None)
+        self.items.pop(item_id, None)
+
+    def candidates(self, question, limit=200):
+        """کاندیدها بر اساس تعداد باندهای مشترک"""
+        signature = self.signature(question)
+        if signature is None:
+            return []
+
+        hits = defaultdict(int)
+        for key in self.band_keys(signature):
+            for item_id in list(self.buckets.get(key, ())):
+                hits[item_id] += 1
+
+        if len(hits) > limit:
+            top_ids = heapq.nlargest(limit, hits, key=hits.__getitem__)
+        else:
+            top_ids = list(hits)
+
+        items = self.items
+        return [items[i] for i in top_ids if i in items]
+
+
+class UnionIndex:
+    """اجتماع کاندیدهای چند ایندکس (بدون تکرار)"""
+
+    def __init__(self, *indexes):
+        self.indexes = indexes
+
+    def __len__(self):
+        return max((len(index) for index in self.indexes), default=0)
+
+    def add(self, item, tokens=None):
+        for index in self.indexes:
+            index.add(item, tokens=tokens)
+
+    def remove(self, item_id):
+        for index in self.indexes:
+            index.remove(item_id)
+
+    def candidates(self, question, limit=200):
+        seen = set()
+        merged = []
+        for index in self.indexes:
+            for item in index.candidates(question, limit=limit):
+                if item.id not in seen:
+                    seen.add(item.id)
+                    merged.append(item)
+        return merged
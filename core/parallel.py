@@ -0,0 +1,171 @@
+import math
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from .similarity import rank_candidates
+from .text_processor import pool_context
+
+# وضعیت هر پردازه کارگر (یک بار در initializer پر می‌شود)
+_worker_state = {}
+
+
+def _init_worker(ids, features, weights, backend, barrier=None):
+    """بارگذاری ویژگی‌های دانش در پردازه کارگر"""
+    _worker_state['barrier'] = barrier
+    _worker_state['ids'] = ids
+    _worker_state['features'] = features
+    _worker_state['weights'] = weights
+    _worker_state['backend'] = backend
+
+
+def _ready(timeout):
+    """کار راه‌اندازی: تا وقتی همه پردازه‌ها بالا نیامده‌اند برنمی‌گردد
+
+    هر پردازه تا رسیدن بقیه روی همین کار منتظر می‌ماند و کار دیگری برنمی‌دارد،
+    پس با یک کار برای هر پردازه، همه پردازه‌ها شروع و مقداردهی شده‌اند.
+    """
+    _worker_state['barrier'].wait(timeout)
+    return os.getpid()
+
+
+def _score_shard(query_features, start, stop, threshold, top_k):
+    """امتیازدهی یک بخش از پیکره و برگرداندن k نتیجه برتر محلی"""
+    pairs = zip(
+        _worker_state['ids'][start:stop],
+        _worker_state['features'][start:stop]
+    )
+    top, count, stages = rank_candidates(
+        query_features, pairs, threshold, top_k,
+        _worker_state['weights'], _worker_state['backend']
+    )
+    return top, count, dict(stages)
+
+
+class _PoolState:
+    """استخر یک نسخه پیکره به همراه تعداد خواننده‌هایی که هنوز از آن استفاده می‌کنند"""
+
+    def __init__(self, executor, items, bounds):
+        self.executor = executor
+        self.items = items      # شناسه -> دانش
+        self.bounds = bounds    # بازه‌های بخش‌ها
+        self.readers = 0
+        self.retired = False
+
+
+class ShardedScorer:
+    """امتیازدهی موازی روی بخش‌های پیکره دانش با استخر پردازه ماندگار
+
+    پردازه‌های استخر جدید داخل load() راه می‌افتند و پیکره را بارگذاری می‌کنند؛
+    تا آماده شدن آن‌ها جستجوها با استخر قبلی انجام می‌شوند. استخر قبلی پس از
+    جایگزینی فقط وقتی بسته می‌شود که آخرین خواننده‌اش کارش را تمام کرده باشد؛
+    بستن زودتر submit خواننده‌ها را با RuntimeError (cannot schedule new
+    futures after shutdown) شکست می‌داد.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.state = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        state = self.state
+        return len(state.items) if state else 0
+
+    def load(self, knowledge_items, features, weights, backend='difflib'):
+        """ساخت استخر جدید برای دانش فعلی و جایگزینی استخر قبلی"""
+        ids = []
+        shard_features = []
+        items = {}
+        for item in knowledge_items:
+            item_features = features.get(item.id)
+            if item_features is None:
+                continue
+            ids.append(item.id)
+            shard_features.append(item_features)
+            items[item.id] = item
+
+        state = None
+        if ids:
+            step = math.ceil(len(ids) / self.workers)
+            bounds = [(start, min(start + step, len(ids))) for start in range(0, len(ids), step)]
+            # این متد از نخ Timer بازسازی صدا زده می‌شود؛ fork در پردازه چندنخی امن نیست
+            context = pool_context()
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(ids, shard_features, dict(weights), backend, context.Barrier(self.workers))
+            )
+            try:
+                self._warm_up(executor)
+            except BaseException:
+                executor.shutdown(wait=False)
+                raise
+            state = _PoolState(executor, items, bounds)
+
+        with self.lock:
+            old, self.state = self.state, state
+        self._retire(old)
+
+    def _warm_up(self, executor, timeout=60.0):
+        """راه‌اندازی همه پردازه‌ها تا هزینه شروع و بارگذاری پیکره در مسیر درخواست نباشد
+
+        استخر تا وقتی پردازه بیکاری ندارد برای هر کار یک پردازه تازه می‌سازد؛
+        کارهای راه‌اندازی هیچ‌کدام پیش از رسیدن همه تمام نمی‌شوند.
+        """
+        futures = [executor.submit(_ready, timeout) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def _retire(self, state):
+        """کنار گذاشتن یک استخر؛ بسته شدن آن با آخرین خواننده"""
+        if state is None:
+            return
+        with self.lock:
+            state.retired = True
+            idle = state.readers == 0
+        if idle:
+            state.executor.shutdown(wait=False)
+
+    def _release(self, state):
+        with self.lock:
+            state.readers -= 1
+            idle = state.retired and state.readers == 0
+        if idle:
+            state.executor.shutdown(wait=False)
+
+    def score(self, query_features, threshold, top_k):
+        """امتیازدهی همه بخش‌ها و ادغام k نتیجه برتر"""
+        with self.lock:
+            state = self.state
+            if state is None:
+                return None
+            state.readers += 1
+
+        try:
+            futures = [
+                state.executor.submit(_score_shard, query_features, start, stop, threshold, top_k)
+                for start, stop in state.bounds
+            ]
+
+            merged = []
+            count = 0
+            stages = Counter()
+            for future in futures:
+                top, shard_count, shard_stages = future.result()
+                merged.extend(top)
+                count += shard_count
+                stages.update(shard_stages)
+        finally:
+            self._release(state)
+
+        merged.sort(key=lambda x: x[0], reverse=True)
+        top = [(score, state.items[key], details) for score, key, details in merged[:top_k]]
+        return top, count, stages
+
+    def shutdown(self):
+        """بستن استخر پردازه‌ها (پس از پایان خواننده‌های فعلی)"""
+        with self.lock:
+            old, self.state = self.state, None
+        self._retire(old)
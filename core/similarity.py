@@ -1,27 +1,62 @@
 import numpy as np
 from difflib import SequenceMatcher
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.feature_extraction.text import TfidfVectorizer
-import json
+from sklearn.base import clone
 from collections import Counter
 import hashlib
 import threading
+import time
 from .text_processor import TextProcessor
+from .edit_distance import char_masks, edit_similarity, batch_edit_similarity
+from utils.cache import Cache
+from utils.metrics import metrics
+
+
+class TextFeatures:
+    """ویژگی‌های پیش‌محاسبه‌شده یک متن برای معیارهای شباهت"""
+    
+    __slots__ = ('text', 'lower', 'tokens', 'keywords', 'hash', 'length', 'masks')
+    
+    def __init__(self, text, lower, tokens, keywords, text_hash, length, masks=None):
+        self.text = text
+        self.lower = lower          # متن کوچک‌شده برای تطابق جزیی
+        self.tokens = tokens        # مجموعه توکن‌ها
+        self.keywords = keywords    # مجموعه کلمات کلیدی
+        self.hash = text_hash       # هش نرمال‌شده
+        self.length = length
+        self.masks = masks          # بیت‌ماسک کاراکترها (برای backend=myers)
+
 
 class SimilarityEngine:
     """موتور محاسبه شباهت پیشرفته"""
     
-    def __init__(self):
+    def __init__(self, cache_size=10000, cache_timeout=300, partial_backend='difflib'):
         self.text_processor = TextProcessor()
+        
+        # پیاده‌سازی partial_match: difflib یا myers (فاصله ویرایشی بیت-موازی)
+        self.partial_backend = partial_backend
         self.vectorizer = TfidfVectorizer(
             max_features=10000,
             ngram_range=(1, 3),
             analyzer='char'
         )
+        # حالت برازش‌شده: (بردارساز، ماتریس CSR، دانش‌ها)
+        self.tfidf_state = None
+        
+        # بردارهای درهم‌سازی‌شده: (ماتریس float32 پیوسته، دانش‌ها)
+        self.vector_state = None
         
-        # کش شباهت‌ها
-        self.similarity_cache = {}
-        self.cache_lock = threading.Lock()
+        # امتیازدهی موازی بخش‌بندی‌شده (در صورت فعال بودن)
+        self.sharded_scorer = None
+        
+        # شمارنده‌های هرس آبشاری
+        self.prune_stats = Counter()
+        self.stats_lock = threading.Lock()
+        
+        # کش شباهت‌ها (محدود و با انقضا)؛ نسخه دانش در کلید است تا نتیجه کهنه برنگردد
+        self.similarity_cache = Cache(max_size=cache_size, default_timeout=cache_timeout)
+        self.generation = 0
+        self.generation_lock = threading.Lock()
         
         # وزن‌دهی به معیارهای مختلف
         self.weights = {
@@ -33,6 +68,42 @@ class SimilarityEngine:
             'length_similarity': 0.3    # شباهت طول
         }
     
+    def build_features(self, text):
+        """ساخت ویژگی‌های یک متن (یک بار برای هر سوال)"""
+        lower = text.lower()
+        canonicalize = self.text_processor.canonicalize
+        return TextFeatures(
+            text=text,
+            lower=lower,
+            tokens=frozenset(canonicalize(self.text_processor.tokenize(text))),
+            keywords=frozenset(canonicalize(
+                self.text_processor.extract_keywords(text, max_keywords=5)
+            )),
+            text_hash=self.text_processor.get_text_hash(text),
+            length=len(text),
+            masks=char_masks(lower) if self.partial_backend == 'myers' else None
+        )
+    
+    def build_features_many(self, texts):
+        """ساخت ویژگی‌های چند متن؛ توکن‌سازی در استخر پردازه انجام می‌شود"""
+        texts = list(texts)
+        backend = self.partial_backend
+        canonicalize = self.text_processor.canonicalize
+        features = []
+        for text, (tokens, keywords, text_hash) in zip(
+                texts, self.text_processor.iter_batch(texts, 'analyze')):
+            lower = text.lower()
+            features.append(TextFeatures(
+                text=text,
+                lower=lower,
+                tokens=frozenset(canonicalize(tokens)),
+                keywords=frozenset(canonicalize(keywords)),
+                text_hash=text_hash,
+                length=len(text),
+                masks=char_masks(lower) if backend == 'myers' else None
+            ))
+        return features
+    
     def exact_match(self, text1, text2):
         """تطابق دقیق (هش شده)"""
         hash1 = self.text_processor.get_text_hash(text1)
@@ -40,60 +111,75 @@ class SimilarityEngine:
         return 1.0 if hash1 == hash2 else 0.0
     
     def partial_match(self, text1, text2):
-        """تطابق جزیی با SequenceMatcher"""
-        return SequenceMatcher(None, text1.lower(), text2.lower()).ratio()
+        """تطابق جزیی با SequenceMatcher یا فاصله ویرایشی Myers"""
+        return partial_score(text1.lower(), text2.lower(), self.partial_backend)
     
     def word_overlap(self, text1, text2):
-        """اشتراک کلمات"""
-        words1 = set(self.text_processor.tokenize(text1))
-        words2 = set(self.text_processor.tokenize(text2))
-        
+        """اشتراک کلمات (با یکسان‌سازی مترادف‌ها)"""
+        canonicalize = self.text_processor.canonicalize
+        words1 = set(canonicalize(self.text_processor.tokenize(text1)))
+        words2 = set(canonicalize(self.text_processor.tokenize(text2)))
+        return self._jaccard(words1, words2)
+    
+    def keyword_match(self, text1, text2):
+        """تطابق بر اساس کلمات کلیدی"""
+        canonicalize = self.text_processor.canonicalize
+        keywords1 = set(canonicalize(self.text_processor.extract_keywords(text1, max_keywords=5)))
+        keywords2 = set(canonicalize(self.text_processor.extract_keywords(text2, max_keywords=5)))
+        return self._keyword_score(keywords1, keywords2)
+    
+    def length_similarity(self, text1, text2):
+        """شباهت بر اساس طول متن"""
+        return self._length_ratio(len(text1), len(text2))
+    
+    @staticmethod
+    def _jaccard(words1, words2):
         if not words1 or not words2:
             return 0.0
         
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
+        intersection = words1 & words2
+        union = words1 | words2
         
         # Jaccard similarity
         return len(intersection) / len(union)
     
-    def keyword_match(self, text1, text2):
-        """تطابق بر اساس کلمات کلیدی"""
-        keywords1 = set(self.text_processor.extract_keywords(text1, max_keywords=5))
-        keywords2 = set(self.text_processor.extract_keywords(text2, max_keywords=5))
-        
+    @staticmethod
+    def _keyword_score(keywords1, keywords2):
         if not keywords1 or not keywords2:
             return 0.0
         
-        common = keywords1.intersection(keywords2)
+        common = keywords1 & keywords2
         
         # وزن‌دهی به کلمات کلیدی مشترک
-        score = len(common) / max(len(keywords1), len(keywords2))
-        
-        return score
+        return len(common) / max(len(keywords1), len(keywords2))
     
-    def length_similarity(self, text1, text2):
-        """شباهت بر اساس طول متن"""
-        len1 = len(text1)
-        len2 = len(text2)
-        
+    @staticmethod
+    def _length_ratio(len1, len2):
         if len1 == 0 or len2 == 0:
             return 0.0
         
         # نسبت طول‌ها
-        ratio = min(len1, len2) / max(len1, len2)
-        return ratio
+        return min(len1, len2) / max(len1, len2)
     
     def combined_similarity(self, text1, text2):
         """ترکیب همه معیارهای شباهت"""
+        return self.features_similarity(
+            self.build_features(text1),
+            self.build_features(text2)
+        )
+    
+    def features_similarity(self, features1, features2):
+        """ترکیب همه معیارهای شباهت روی ویژگی‌های پیش‌محاسبه‌شده"""
         
         # محاسبه همه معیارها
         similarities = {
-            'exact_match': self.exact_match(text1, text2),
-            'partial_match': self.partial_match(text1, text2),
-            'word_overlap': self.word_overlap(text1, text2),
-            'keyword_match': self.keyword_match(text1, text2),
-            'length_similarity': self.length_similarity(text1, text2)
+            'exact_match': 1.0 if features1.hash == features2.hash else 0.0,
+            'partial_match': partial_score(
+                features1.lower, features2.lower, self.partial_backend, features2.masks
+            ),
+            'word_overlap': self._jaccard(features1.tokens, features2.tokens),
+            'keyword_match': self._keyword_score(features1.keywords, features2.keywords),
+            'length_similarity': self._length_ratio(features1.length, features2.length)
         }
         
         # محاسبه امتیاز نهایی با وزن‌ها
@@ -109,52 +195,411 @@ class SimilarityEngine:
         
         return final_score, similarities
     
-    def find_best_match(self, question, knowledge_items, threshold=0.6):
+    def bump_generation(self):
+        """اعلام تغییر دانش: نتایج کش‌شده قبلی دیگر استفاده نمی‌شوند"""
+        with self.generation_lock:
+            self.generation += 1
+            self.similarity_cache.clear()
+            return self.generation
+    
+    def get_prune_stats(self):
+        """آمار هرس آبشاری"""
+        with self.stats_lock:
+            return dict(self.prune_stats)
+    
+    def fit_corpus(self, knowledge_items):
+        """برازش TF-IDF روی همه سوالات فعال و نگهداری ماتریس CSR در حافظه"""
+        items = list(knowledge_items)
+        if not items:
+            self.tfidf_state = None
+            return
+        
+        # بردارساز جدید تا جستجوهای در حال اجرا روی حالت قبلی بمانند
+        vectorizer = clone(self.vectorizer)
+        matrix = vectorizer.fit_transform([item.question for item in items]).tocsr()
+        
+        # جایگزینی اتمیک حالت
+        self.tfidf_state = (vectorizer, matrix, items)
+    
+    def fit_vectors(self, knowledge_items, vectors):
+        """نگهداری بردارهای همه دانش‌ها در یک ماتریس پیوسته"""
+        items = list(knowledge_items)
+        if not items:
+            self.vector_state = None
+            return
+        
+        matrix = np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+        self.vector_state = (matrix, items)
+    
+    def vector_match(self, question, threshold=0.6, top_k=5):
+        """شباهت کسینوسی با همه دانش‌ها در یک ضرب داخلی"""
+        state = self.vector_state
+        if state is None:
+            return None
+        
+        matrix, items = state
+        scores = matrix @ self.text_processor.hash_vector(question)
+        return self._scores_result(scores, items, threshold, top_k, metric='semantic')
+    
+    def fit_shards(self, knowledge_items, features, workers=4):
+        """تقسیم ویژگی‌های دانش بین پردازه‌های کارگر ماندگار"""
+        if self.sharded_scorer is None:
+            from .parallel import ShardedScorer
+            self.sharded_scorer = ShardedScorer(workers=workers)
+        self.sharded_scorer.load(knowledge_items, features, self.weights, self.partial_backend)
+    
+    def find_best_match(self, question, knowledge_items, threshold=0.6,
+                        index=None, candidate_limit=200, features=None,
+                        mode='combined', top_k=5):
         """پیدا کردن بهترین تطابق"""
         
-        cache_key = hashlib.md5(question.encode()).hexdigest()
+        generation = self.generation
+        cache_key = f"{generation}:" + hashlib.md5(f"{mode}:{question}".encode()).hexdigest()
         
         # بررسی کش
-        with self.cache_lock:
-            if cache_key in self.similarity_cache:
-                cached = self.similarity_cache[cache_key]
-                # کش به مدت 5 دقیقه معتبر است
-                if cached['time'] > 0:
-                    return cached['result']
-        
-        best_match = None
-        best_score = 0
-        all_matches = []
-        
-        for item in knowledge_items:
-            score, details = self.combined_similarity(question, item.question)
+        cached = self.similarity_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        result = None
+        if mode in ('tfidf', 'sharded', 'vector'):
+            with metrics.timer('scoring'):
+                if mode == 'tfidf':
+                    result = self.tfidf_match(question, threshold, top_k)
+                elif mode == 'sharded':
+                    result = self.sharded_match(question, threshold, top_k)
+                else:
+                    result = self.vector_match(question, threshold, top_k)
+        if result is None:
+            result = self.combined_match(
+                question, knowledge_items, threshold,
+                index=index,
+                candidate_limit=candidate_limit,
+                features=features,
+                top_k=top_k
+            )
+        
+        # ذخیره در کش
+        self.similarity_cache.set(cache_key, result)
+        
+        return result
+    
+    def tfidf_match(self, question, threshold=0.6, top_k=5):
+        """امتیازدهی کل پیکره با یک ضرب ماتریس اسپارس در بردار"""
+        state = self.tfidf_state
+        if state is None:
+            return None
+        
+        vectorizer, matrix, items = state
+        
+        # ردیف‌ها نرمال L2 هستند، پس ضرب داخلی همان شباهت کسینوسی است
+        query_vector = vectorizer.transform([question])
+        scores = (matrix @ query_vector.T).toarray().ravel()
+        
+        return self._scores_result(scores, items, threshold, top_k)
+    
+    @staticmethod
+    def _top_indices(scores, top_k):
+        """انتخاب top-k بدون مرتب‌سازی کامل"""
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return np.array([], dtype=int)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+    
+    def _scores_result(self, scores, items, threshold, top_k, metric='tfidf'):
+        """تبدیل آرایه امتیازهای کسینوسی به خروجی استاندارد"""
+        all_matches = [
+            {
+                'item': items[i],
+                'score': float(scores[i]),
+                'details': {metric: float(scores[i])}
+            }
+            for i in self._top_indices(scores, top_k) if scores[i] >= threshold
+        ]
+        
+        best = all_matches[0] if all_matches else None
+        
+        return {
+            'best_match': best['item'] if best else None,
+            'best_score': best['score'] if best else 0,
+            'matches': all_matches,
+            'count': int(np.count_nonzero(scores >= threshold)),
+            'candidates': len(items)
+        }
+    
+    def find_best_matches(self, questions, knowledge_items, threshold=0.6,
+                          features=None, mode='combined', top_k=5,
+                          candidate_limit=200, batch_size=256):
+        """پیدا کردن بهترین تطابق برای چند سوال به صورت دسته‌ای
+        
+        همه سوالات یک دسته با یک ضرب ماتریس اسپارس در کل پیکره امتیاز می‌گیرند؛
+        در حالت combined همین امتیازها کاندیدها را برای امتیازدهی آبشاری انتخاب می‌کنند.
+        """
+        start_time = time.time()
+        questions = list(questions)
+        
+        if self.tfidf_state is None:
+            self.fit_corpus(knowledge_items)
+        state = self.tfidf_state
+        
+        results = []
+        if state is None:
+            # پیکره خالی
+            results = [
+                {'best_match': None, 'best_score': 0, 'matches': [], 'count': 0, 'candidates': 0}
+                for _ in questions
+            ]
+        else:
+            vectorizer, matrix, items = state
+            matrix_t = matrix.T.tocsc()
+            
+            # حافظه ماتریس امتیاز متراکم هر دسته محدود می‌ماند (~۱۶ میلیون خانه)
+            batch_size = max(1, min(batch_size, (1 << 24) // max(1, len(items))))
             
-            if score >= threshold:
-                all_matches.append({
-                    'item': item,
-                    'score': score,
-                    'details': details
-                })
+            for offset in range(0, len(questions), batch_size):
+                batch = questions[offset:offset + batch_size]
                 
-                if score > best_score:
-                    best_score = score
-                    best_match = item
-        
-        # مرتب‌سازی نتایج
-        all_matches.sort(key=lambda x: x['score'], reverse=True)
-        
-        result = {
-            'best': best_match,
-            'best_score': best_score,
-            'matches': all_matches[:5],  # ۵ نتیجه برتر
-            'count': len(all_matches)
+                # توکن‌سازی و امتیازدهی دسته‌ای
+                scores = (vectorizer.transform(batch) @ matrix_t).toarray()
+                
+                for question, row in zip(batch, scores):
+                    if mode == 'tfidf':
+                        results.append(self._scores_result(row, items, threshold, top_k))
+                        continue
+                    
+                    candidates = [items[i] for i in self._top_indices(row, candidate_limit)]
+                    results.append(self.combined_match(
+                        question, candidates, threshold,
+                        features=features,
+                        top_k=top_k
+                    ))
+        
+        elapsed = time.time() - start_time
+        
+        return {
+            'results': results,
+            'count': len(questions),
+            'elapsed': elapsed,
+            'questions_per_second': len(questions) / elapsed if elapsed > 0 else 0
         }
+    
+    def sharded_match(self, question, threshold=0.6, top_k=5):
+        """امتیازدهی کل پیکره به صورت موازی روی بخش‌ها"""
+        if self.sharded_scorer is None:
+            return None
         
-        # ذخیره در کش
-        with self.cache_lock:
-            self.similarity_cache[cache_key] = {
-                'result': result,
-                'time': 300  # 5 دقیقه
-            }
+        scored = self.sharded_scorer.score(self.build_features(question), threshold, top_k)
+        if scored is None:
+            return None
         
-        return result
+        top, count, stages = scored
+        with self.stats_lock:
+            self.prune_stats.update(stages)
+        
+        return {
+            'best_match': top[0][1] if top else None,
+            'best_score': top[0][0] if top else 0,
+            'matches': [
+                {'item': item, 'score': score, 'details': details}
+                for score, item, details in top
+            ],
+            'count': count,
+            'candidates': len(self.sharded_scorer)
+        }
+    
+    def combined_match(self, question, knowledge_items, threshold=0.6,
+                       index=None, candidate_limit=200, features=None, top_k=5):
+        """امتیازدهی ترکیبی روی کاندیدهای ایندکس"""
+        
+        # انتخاب کاندیدها از ایندکس معکوس (در صورت نبود نتیجه، جستجوی کامل)
+        candidates = None
+        if index is not None:
+            with metrics.timer('candidate_retrieval'):
+                candidates = index.candidates(question, limit=candidate_limit)
+        if not candidates:
+            # list() اتمیک است؛ دانش ممکن است هم‌زمان در جا تغییر کند
+            candidates = list(knowledge_items)
+        
+        # ویژگی‌های سوال فقط یک بار محاسبه می‌شود
+        query_features = self.build_features(question)
+        if features is None:
+            features = {}
+        
+        def pairs():
+            for item in candidates:
+                item_features = features.get(item.id)
+                if item_features is None:
+                    item_features = self.build_features(item.question)
+                yield item, item_features
+        
+        with metrics.timer('scoring'):
+            top, count, stages = rank_candidates(
+                query_features, pairs(), threshold, top_k, self.weights, self.partial_backend
+            )
+        
+        with self.stats_lock:
+            self.prune_stats.update(stages)
+        
+        return {
+            'best_match': top[0][1] if top else None,
+            'best_score': top[0][0] if top else 0,
+            'matches': [
+                {'item': item, 'score': score, 'details': details}
+                for score, item, details in top
+            ],
+            'count': count,
+            'candidates': len(candidates)
+        }
+
+
+def partial_score(text1, text2, backend='difflib', masks2=None):
+    """امتیاز partial_match بین دو متن کوچک‌شده"""
+    if backend == 'myers':
+        # الگو متن دوم (سوال ذخیره‌شده) است تا ماسک‌های آماده‌اش استفاده شود
+        if masks2 is None:
+            masks2 = char_masks(text2)
+        return edit_similarity(masks2, len(text2), text1)
+    return SequenceMatcher(None, text1, text2).ratio()
+
+
+def _metric_weights(weights):
+    return (
+        weights.get('exact_match', 0.5),
+        weights.get('partial_match', 0.5),
+        weights.get('word_overlap', 0.5),
+        weights.get('keyword_match', 0.5),
+        weights.get('length_similarity', 0.5)
+    )
+
+
+def _cheap_stages(features1, features2, bar, weights, backend):
+    """مراحل ارزان آبشار؛ در صورت هرس (None, مرحله) و گرنه (امتیاز معلوم، معیارها)"""
+    w_exact, w_partial, w_overlap, w_keyword, w_length = weights
+    total_weight = sum(weights)
+    
+    # مرحله ۱: هش و طول (سقف partial_match از روی طول‌ها)
+    exact = 1.0 if features1.hash == features2.hash else 0.0
+    length = SimilarityEngine._length_ratio(features1.length, features2.length)
+    len1, len2 = len(features1.lower), len(features2.lower)
+    if backend == 'myers':
+        # فاصله ویرایشی حداقل اختلاف طول‌هاست
+        partial_bound = min(len1, len2) / max(len1, len2) if max(len1, len2) else 1.0
+    else:
+        partial_bound = 2.0 * min(len1, len2) / (len1 + len2) if len1 + len2 else 1.0
+    
+    known = w_exact * exact + w_length * length
+    if (known + w_partial * partial_bound + w_overlap + w_keyword) / total_weight < bar:
+        return None, 'length'
+    
+    # مرحله ۲: اشتراک کلمات و کلمات کلیدی روی مجموعه‌های آماده
+    overlap = SimilarityEngine._jaccard(features1.tokens, features2.tokens)
+    keyword = SimilarityEngine._keyword_score(features1.keywords, features2.keywords)
+    known += w_overlap * overlap + w_keyword * keyword
+    if (known + w_partial * partial_bound) / total_weight < bar:
+        return None, 'overlap'
+    
+    return known, (exact, overlap, keyword, length)
+
+
+def _similarities(parts, partial):
+    exact, overlap, keyword, length = parts
+    return {
+        'exact_match': exact,
+        'partial_match': partial,
+        'word_overlap': overlap,
+        'keyword_match': keyword,
+        'length_similarity': length
+    }
+
+
+def cascade_score(features1, features2, bar, weights, backend='difflib'):
+    """امتیازدهی آبشاری: معیارهای ارزان اول، partial_match فقط در صورت نیاز
+    
+    اگر سقف امتیاز ممکن به bar نرسد، (None, None, مرحله) برمی‌گرداند.
+    """
+    metric_weights = _metric_weights(weights)
+    total_weight = sum(metric_weights)
+    if total_weight <= 0:
+        return 0, {}, 'full'
+    
+    known, parts = _cheap_stages(features1, features2, bar, metric_weights, backend)
+    if known is None:
+        return None, None, parts
+    
+    w_partial = metric_weights[1]
+    if backend == 'myers':
+        partial = partial_score(features1.lower, features2.lower, backend, features2.masks)
+    else:
+        # مرحله ۳: سقف ارزان‌تر SequenceMatcher قبل از ratio
+        matcher = SequenceMatcher(None, features1.lower, features2.lower)
+        if (known + w_partial * matcher.quick_ratio()) / total_weight < bar:
+            return None, None, 'quick_ratio'
+        partial = matcher.ratio()
+    
+    return (known + w_partial * partial) / total_weight, _similarities(parts, partial), 'full'
+
+
+def rank_candidates(query_features, candidates, threshold, top_k, weights, backend='difflib'):
+    """امتیازدهی آبشاری گروهی از (کلید، ویژگی‌ها) و انتخاب k نتیجه برتر
+    
+    خروجی: (لیست مرتب (امتیاز، کلید، جزئیات)، تعداد تطابق‌ها، شمارنده مراحل)
+    
+    هرس فقط با آستانه انجام می‌شود، نه با k-امین امتیاز برتر: تعداد تطابق‌ها
+    (matches_count در پاسخ) باید همه دانش‌های بالای آستانه را بشمارد و امتیاز
+    دانشی که با k-امین امتیاز هرس شود معلوم نیست.
+    """
+    if backend == 'myers':
+        return _rank_batched(query_features, candidates, threshold, top_k, weights)
+    
+    all_matches = []
+    stages = Counter()
+    
+    for key, item_features in candidates:
+        score, details, stage = cascade_score(query_features, item_features, threshold, weights, backend)
+        stages[stage] += 1
+        
+        if score is not None and score >= threshold:
+            all_matches.append((score, key, details))
+    
+    # مرتب‌سازی پایدار بر اساس امتیاز
+    all_matches.sort(key=lambda x: x[0], reverse=True)
+    return all_matches[:top_k], len(all_matches), stages
+
+
+def _rank_batched(query_features, candidates, threshold, top_k, weights):
+    """نسخه دومرحله‌ای برای backend=myers: هرس ارزان، سپس فاصله ویرایشی برداری"""
+    metric_weights = _metric_weights(weights)
+    total_weight = sum(metric_weights)
+    stages = Counter()
+    
+    survivors = []
+    for key, item_features in candidates:
+        known, parts = _cheap_stages(
+            query_features, item_features, threshold, metric_weights, 'myers'
+        )
+        if known is None:
+            stages[parts] += 1
+            continue
+        survivors.append((key, item_features, known, parts))
+    
+    stages['full'] += len(survivors)
+    if not survivors or total_weight <= 0:
+        return [], 0, stages
+    
+    partials = batch_edit_similarity(
+        query_features.lower,
+        [f.masks if f.masks is not None else char_masks(f.lower) for _, f, _, _ in survivors],
+        [len(f.lower) for _, f, _, _ in survivors]
+    )
+    
+    all_matches = []
+    w_partial = metric_weights[1]
+    for (key, _, known, parts), partial in zip(survivors, partials):
+        partial = float(partial)
+        score = (known + w_partial * partial) / total_weight
+        if score >= threshold:
+            all_matches.append((score, key, _similarities(parts, partial)))
+    
+    all_matches.sort(key=lambda x: x[0], reverse=True)
+    return all_matches[:top_k], len(all_matches), stages
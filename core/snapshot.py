@@ -0,0 +1,53 @@
+class KnowledgeRecord:
+    """نسخه فقط‌خواندنی و فشرده یک دانش (بدون وضعیت ORM)
+
+    فقط ستون‌هایی که برای جستجو لازم‌اند نگه داشته می‌شوند؛ متن جواب فقط برای
+    دانش انتخاب‌شده از دیتابیس خوانده می‌شود (Brain.answer_text). تغییر یک
+    دانش با ساخت رکورد جدید و جایگزینی مرجع انجام می‌شود، نه تغییر این شیء.
+    """
+
+    __slots__ = ('id', 'question', 'updated_at')
+
+    def __init__(self, id, question, updated_at=None):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'question', question)
+        object.__setattr__(self, 'updated_at', updated_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('KnowledgeRecord is read-only')
+
+    def __reduce__(self):
+        # pickle/copy بدون __setattr__ (برای ارسال به پردازه‌ها و کش)
+        return (KnowledgeRecord, (self.id, self.question, self.updated_at))
+
+    def __repr__(self):
+        return f'<KnowledgeRecord {self.id}>'
+
+    @classmethod
+    def from_row(cls, row):
+        """ساخت از یک ردیف (Knowledge یا نتیجه پرس‌وجوی ستونی)"""
+        return cls(row.id, row.question, row.updated_at)
+
+
+class KnowledgeSnapshot:
+    """مجموعه ساختارهای جستجوی دانش که با یک جایگزینی مرجع منتشر می‌شود
+
+    خواننده‌ها یک بار self.snapshot را می‌خوانند و تا پایان درخواست با همان
+    کار می‌کنند، پس بارگذاری کامل هم‌زمان هرگز ساختارها را مخلوط نمی‌کند.
+    یادگیری/فراموشی تک‌دانش با انتساب‌های اتمیک تک‌کلیدی در همین تصویر اعمال
+    می‌شود (هزینه مستقل از اندازه دانش)؛ خواننده‌ها قفل نمی‌گیرند، دیکشنری‌ها را
+    فقط با یک list() اتمیک پیمایش می‌کنند و نبودن یک شناسه را تحمل می‌کنند.
+    """
+
+    __slots__ = ('items', 'features', 'hash_map', 'index', 'lsh', 'max_updated_at')
+
+    def __init__(self, items, features, hash_map, index, lsh=None, max_updated_at=None):
+        self.items = items                    # شناسه -> KnowledgeRecord
+        self.features = features              # شناسه -> TextFeatures
+        self.hash_map = hash_map              # هش سوال -> KnowledgeRecord
+        self.index = index                    # ایندکس کاندیدها
+        self.lsh = lsh                        # ایندکس MinHash (در صورت فعال بودن)
+        self.max_updated_at = max_updated_at  # بیشترین تغییر دیده‌شده (حذف‌ها هم)؛ برای بررسی هماهنگی
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,199 @@
+import os
+import threading
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import fcntl
+except ImportError:  # ویندوز
+    fcntl = None
+
+
+def connect_redis(url):
+    """اتصال به Redis؛ None اگر کتابخانه نصب نیست یا سرور در دسترس نیست"""
+    if redis is None or not url:
+        return None
+    try:
+        client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        client.ping()
+        return client
+    except Exception:
+        return None
+
+
+# افزایش نسخه و ثبت نسخه آخرین بارگذاری کامل در یک گام اتمیک
+_BUMP_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+if ARGV[1] == '1' then
+    redis.call('SET', KEYS[2], version)
+end
+return version
+"""
+
+
+class RedisVersion:
+    """شمارنده نسخه دانش در Redis با اعلان pub/sub برای تأخیر کم"""
+
+    def __init__(self, client, key='brain:knowledge:version', channel='brain:knowledge'):
+        self.client = client
+        self.key = key
+        self.reload_key = f'{key}:reload'
+        self.channel = channel
+        self.pubsub = None
+        self.script = client.register_script(_BUMP_SCRIPT)
+
+    def bump(self, reload=False):
+        version = int(self.script(keys=[self.key, self.reload_key], args=['1' if reload else '0']))
+        self.client.publish(self.channel, version)
+        return version
+
+    def current(self):
+        """(نسخه فعلی، نسخه آخرین بارگذاری کامل)"""
+        version, reload_version = self.client.mget(self.key, self.reload_key)
+        return int(version or 0), int(reload_version or 0)
+
+    def wait(self, timeout):
+        """انتظار تا اعلان بعدی یا پایان timeout"""
+        if self.pubsub is None:
+            self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.subscribe(self.channel)
+        self.pubsub.get_message(timeout=timeout)
+
+
+class FileVersion:
+    """شمارنده نسخه دانش در یک فایل مشترک (بدون Redis؛ همه کارگرها روی یک میزبان)"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.stop = threading.Event()
+
+    @staticmethod
+    def _parse(content):
+        """محتوای فایل: «نسخه نسخه‌_آخرین_بارگذاری_کامل»"""
+        parts = content.split()
+        version = int(parts[0]) if parts else 0
+        reload_version = int(parts[1]) if len(parts) > 1 else 0
+        return version, reload_version
+
+    def bump(self, reload=False):
+        with open(self.path, 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            version, reload_version = self._parse(f.read())
+            version += 1
+            if reload:
+                reload_version = version
+            f.seek(0)
+            f.truncate()
+            f.write(f'{version} {reload_version}')
+            f.flush()
+        return version
+
+    def current(self):
+        """(نسخه فعلی، نسخه آخرین بارگذاری کامل)"""
+        try:
+            with open(self.path) as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                return self._parse(f.read())
+        except (OSError, ValueError):
+            return 0, 0
+
+    def wait(self, timeout):
+        self.stop.wait(timeout)
+
+
+class KnowledgeSync:
+    """پخش نسخه دانش بین کارگرهای gunicorn
+
+    هر تغییر (learn/forget/بارگذاری فایل) نسخه مشترک را یک واحد بالا می‌برد؛
+    نخ پس‌زمینه هر کارگر حداکثر هر poll_interval ثانیه نسخه را مقایسه می‌کند
+    (با Redis بلافاصله پس از اعلان) و با تغییر آن، on_change(full) را صدا می‌زند؛
+    full یعنی از آخرین نسخه دیده‌شده یک بارگذاری کامل (مثلاً فایل آموزشی) اعلان شده است.
+    """
+
+    def __init__(self, redis_client=None, version_file='logs/knowledge.version', poll_interval=1.0):
+        self.poll_interval = poll_interval
+
+        if redis_client is not None:
+            self.backend = RedisVersion(redis_client)
+        else:
+            self.backend = FileVersion(version_file)
+
+        self.seen = self.backend.current()[0]
+        self.on_change = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    @property
+    def backend_name(self):
+        return 'redis' if isinstance(self.backend, RedisVersion) else 'file'
+
+    def publish(self, reload=False):
+        """اعلان یک تغییر دانش به همه کارگرها
+
+        reload: کارگرها به جای خواندن ردیف‌های تغییرکرده کل دانش را بارگذاری کنند
+        """
+        with self.lock:
+            try:
+                version = self.backend.bump(reload)
+            except Exception as e:
+                print(f"⚠️ خطا در اعلان تغییر دانش: {e}")
+                return None
+
+            # تغییر خود این کارگر از قبل در حافظه اعمال شده است
+            if version == self.seen + 1:
+                self.seen = version
+        return version
+
+    def start(self, on_change):
+        """شروع نخ گوش‌دهنده (یک بار برای هر پردازه)"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.on_change = on_change
+            self.thread = threading.Thread(target=self._run, name='knowledge-sync', daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                self.backend.wait(self.poll_interval)
+                self.check()
+            except Exception as e:
+                print(f"⚠️ خطا در همگام‌سازی دانش: {e}")
+                self.stopping.wait(self.poll_interval)
+
+    def check(self):
+        """مقایسه نسخه مشترک با آخرین نسخه دیده‌شده؛ True اگر تغییری اعمال شد
+
+        seen (که بخشی از کلید کش جواب است) فقط پس از پایان on_change جلو می‌رود؛
+        وگرنه درخواستی با نسل جدید روی تصویر قدیمی جستجو می‌کند و جواب کهنه را
+        با کلید جدید در کش مشترک می‌نویسد. اگر on_change خطا بدهد نسخه دیده‌نشده
+        می‌ماند و دور بعد دوباره تلاش می‌شود.
+        """
+        version, reload_version = self.backend.current()
+        with self.lock:
+            if version == self.seen:
+                return False
+            full = reload_version > self.seen
+
+        if self.on_change is not None:
+            self.on_change(full)
+
+        with self.lock:
+            self.seen = max(self.seen, version)
+        return True
+
+    def stop(self):
+        self.stopping.set()
+        if isinstance(self.backend, FileVersion):
+            self.backend.stop.set()
@@ -1,19 +1,90 @@
 import re
-import nltk
-from nltk.tokenize import word_tokenize, sent_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import ISRIStemmer, PorterStemmer
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
+import os
+import zlib
 import hashlib
 import json
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict, deque
 import threading
+import multiprocessing
+import numpy as np
+from config import Config
+
+# کلمات توقف انگلیسی (همان فهرست NLTK) برای وقتی که داده‌های NLTK در دسترس نیست
+ENGLISH_STOPWORDS = frozenset("""
+i me my myself we our ours ourselves you you're you've you'll you'd your yours
+yourself yourselves he him his himself she she's her hers herself it it's its
+itself they them their theirs themselves what which who whom this that that'll
+these those am is are was were be been being have has had having do does did
+doing a an the and but if or because as until while of at by for with about
+against between into through during before after above below to from up down
+in out on off over under again further then once here there when where why how
+all any both each few more most other some such no nor not only own same so
+than too very s t can will just don don't should should've now d ll m o re ve
+y ain aren aren't couldn couldn't didn didn't doesn doesn't hadn hadn't hasn
+hasn't haven haven't isn isn't ma mightn mightn't mustn mustn't needn needn't
+shan shan't shouldn shouldn't wasn wasn't weren weren't won won't wouldn
+wouldn't
+""".split())
+
+# توکن‌ساز ساده regex وقتی punkt موجود نیست
+_TOKEN_PATTERN = re.compile(r'\w+(?:\.\w+)*|[^\w\s]')
+
+
+def regex_tokenize(text):
+    """توکن‌سازی بدون NLTK (کلمات، اعداد اعشاری و علائم جدا)"""
+    return _TOKEN_PATTERN.findall(text)
+
+
+# جدول یکسان‌سازی حروف و حذف اعراب (معادل normalize_persian در یک گذر)
+_PERSIAN_TABLE = str.maketrans({
+    'ي': 'ی', 'ك': 'ک',
+    'ة': 'ه', 'ۀ': 'ه',
+    'إ': 'ا', 'أ': 'ا',
+    '\u064e': None, '\u064f': None, '\u0650': None,
+    '\u0651': None, '\u0652': None, '\u0640': None,
+})
+
+# کاراکترهایی که clean_text حذف می‌کند (داخل کلمه نادیده گرفته می‌شوند)
+_REMOVABLE = r'[^\w\s?!؟.،]'
+_REMOVABLE_PATTERN = re.compile(_REMOVABLE)
+
+# یک regex برای پاکسازی + توکن‌سازی: کلمات (و اعداد اعشاری) با نادیده گرفتن
+# کاراکترهای حذفی؛ علائم تک‌کاراکتری تولید نمی‌شوند چون در هر حال حذف می‌شدند
+_GLUED_WORD = r'(?:\w' + _REMOVABLE + r'*)+'
+_FAST_TOKEN_PATTERN = re.compile(
+    _GLUED_WORD + r'(?:\.' + _REMOVABLE + r'*' + _GLUED_WORD + r')*'
+)
+
+# استخر پردازه ماندگار برای پردازش دسته‌ای (در اولین استفاده ساخته می‌شود)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def pool_context():
+    """زمینه چندپردازشی استخرها: forkserver (یا spawn در نبود آن)، نه fork
+
+    کارگرهای وب چندنخی‌اند؛ fork قفل‌های گرفته‌شده در نخ‌های دیگر (مثل
+    cache_lock) را قفل‌شده به پردازه فرزند می‌برد و فرزند برای همیشه منتظر می‌ماند.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
 
-# دانلود داده‌های NLTK
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
-nltk.download('wordnet', quiet=True)
+def _get_process_pool(workers):
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context())
+        return _process_pool
+
+
+def _process_chunk(func, chunk):
+    """اجرای یک تکه در پردازه کارگر؛ func نام متد TextProcessor یا تابع ماژول است"""
+    if isinstance(func, str):
+        func = getattr(TextProcessor(), func)
+    return [func(text) for text in chunk]
 
 class TextProcessor:
     """پردازشگر پیشرفته متن با قابلیت‌های چندزبانه"""
@@ -35,12 +106,18 @@ class TextProcessor:
     
     def setup_processors(self):
         """تنظیم پردازشگرها"""
-        # استمرهای فارسی و انگلیسی
-        self.arabic_stemmer = ISRIStemmer()
-        self.english_stemmer = PorterStemmer()
+        # منابع NLTK در اولین استفاده بارگذاری می‌شوند (load_nltk)
+        self.nltk_ready = False
+        self.nltk_lock = threading.Lock()
+        self.arabic_stemmer = None
+        self.english_stemmer = None
+        self.word_tokenize = regex_tokenize
+        # 'auto': مسیر سریع فقط وقتی punkt نیست (معادل توکن‌ساز regex است)؛ True/False اجباری
+        self.fast_tokenizer = Config.BRAIN_CONFIG.get('fast_tokenizer', 'auto')
+        self.fast_path = False
         
         # کلمات توقف
-        self.stop_words = set(stopwords.words('english'))
+        self.stop_words = set(ENGLISH_STOPWORDS)
         # کلمات توقف فارسی
         persian_stops = {'و', 'در', 'به', 'از', 'که', 'این', 'آن', 'با', 'برای', 'تا', 'بر', 
                         'هم', 'نیز', 'را', 'ای', 'های', 'مورد', 'ها', 'کرد', 'شده', 'می',
@@ -56,18 +133,94 @@ class TextProcessor:
             'مصنوعی': ['ساختگی', 'مجازی'],
             'سلام': ['درود', 'احوال', 'خوبی'],
         }
+        self.use_synonyms = Config.BRAIN_CONFIG.get('use_synonyms', True)
+        self.load_synonyms(Config.BRAIN_CONFIG.get('synonyms_file'))
         
-        # بردارساز TF-IDF
-        self.vectorizer = TfidfVectorizer(
-            max_features=10000,
-            ngram_range=(1, 3),
-            analyzer='char_wb'  # برای زبان فارسی بهتر کار می‌کند
-        )
-        
-        # حافظه موقت برای پردازش‌های تکراری
-        self.cache = {}
+        # حافظه موقت برای پردازش‌های تکراری (LRU محدود)
+        self.cache = OrderedDict()
+        self.cache_size = Config.BRAIN_CONFIG.get('text_cache_size', 50000)
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.cache_lock = threading.Lock()
     
+    def load_nltk(self):
+        """بارگذاری تنبل و آفلاین‌امن منابع NLTK (فقط یک بار)"""
+        if self.nltk_ready:
+            return
+        
+        with self.nltk_lock:
+            if self.nltk_ready:
+                return
+            
+            try:
+                import nltk
+            except ImportError:
+                nltk = None
+            
+            if nltk is not None:
+                # دانلود فقط در صورت درخواست صریح (مثلاً در زمان ساخت ایمیج)
+                if Config.BRAIN_CONFIG.get('nltk_download', False):
+                    for resource in ('punkt', 'stopwords'):
+                        try:
+                            nltk.download(resource, quiet=True)
+                        except Exception:
+                            pass
+                
+                from nltk.stem import ISRIStemmer, PorterStemmer
+                self.arabic_stemmer = ISRIStemmer()
+                self.english_stemmer = PorterStemmer()
+                
+                try:
+                    from nltk.corpus import stopwords
+                    self.stop_words.update(stopwords.words('english'))
+                except LookupError:
+                    pass  # فهرست داخلی کافی است
+                
+                try:
+                    nltk.data.find('tokenizers/punkt')
+                    from nltk.tokenize import word_tokenize
+                    self.word_tokenize = word_tokenize
+                except LookupError:
+                    pass  # توکن‌ساز regex
+            
+            # مسیر سریع فقط با توکن‌ساز regex هم‌ارز است؛ punkt نصب‌شده کنار گذاشته نمی‌شود
+            if self.fast_tokenizer == 'auto':
+                self.fast_path = self.word_tokenize is regex_tokenize
+            else:
+                self.fast_path = bool(self.fast_tokenizer)
+            
+            self.nltk_ready = True
+    
+    def _cache_get(self, key):
+        """خواندن از حافظه موقت (None یعنی نبود)"""
+        with self.cache_lock:
+            value = self.cache.get(key)
+            if value is None:
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+                self.cache.move_to_end(key)
+            return value
+    
+    def _cache_set(self, key, value):
+        """ذخیره در حافظه موقت با حذف قدیمی‌ترین مورد"""
+        with self.cache_lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+    
+    def get_cache_stats(self):
+        """آمار حافظه موقت پردازش متن"""
+        with self.cache_lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'size': len(self.cache),
+                'hit_ratio': self.cache_hits / total if total else 0
+            }
+    
     def clean_text(self, text):
         """پاکسازی کامل متن"""
         if not text:
@@ -97,14 +250,46 @@ class TextProcessor:
         return text
     
     def tokenize(self, text):
-        """توکن‌سازی پیشرفته"""
+        """توکن‌سازی پیشرفته (با حافظه موقت)"""
+        key = ('tokenize', text)
+        cached = self._cache_get(key)
+        if cached is None:
+            self.load_nltk()
+            if self.fast_path:
+                cached = tuple(self.fast_tokenize(text))
+            else:
+                cached = tuple(self._tokenize(text))
+            self._cache_set(key, cached)
+        return list(cached)
+    
+    def fast_tokenize(self, text):
+        """مسیر سریع: نرمال‌سازی با translate و توکن‌سازی با یک regex
+        
+        خروجی همان clean_text + normalize_persian + توکن‌ساز regex + فیلترهاست.
+        """
+        if not text:
+            return []
+        
+        self.load_nltk()
+        stop_words = self.stop_words
+        tokens = []
+        for token in _FAST_TOKEN_PATTERN.findall(text.translate(_PERSIAN_TABLE)):
+            if not token.isalnum():
+                # نقطه، زیرخط یا کاراکتر حذفی داخل توکن
+                token = _REMOVABLE_PATTERN.sub('', token)
+            if len(token) > 1 and token.lower() not in stop_words:
+                tokens.append(token)
+        return tokens
+    
+    def _tokenize(self, text):
+        self.load_nltk()
         try:
             # پاکسازی اولیه
             text = self.clean_text(text)
             text = self.normalize_persian(text)
             
             # توکن‌سازی
-            tokens = word_tokenize(text)
+            tokens = self.word_tokenize(text)
             
             # حذف کلمات توقف
             tokens = [t for t in tokens if t.lower() not in self.stop_words]
@@ -118,23 +303,65 @@ class TextProcessor:
             return text.split()
     
     def stem_word(self, word):
-        """ریشه‌یابی کلمه"""
-        if re.search(r'[a-zA-Z]', word):
-            return self.english_stemmer.stem(word)
-        else:
-            return self.arabic_stemmer.stem(word)
+        """ریشه‌یابی کلمه (با حافظه موقت)"""
+        key = ('stem', word)
+        stem = self._cache_get(key)
+        if stem is None:
+            self.load_nltk()
+            if self.english_stemmer is None:
+                stem = word  # NLTK نصب نیست
+            elif re.search(r'[a-zA-Z]', word):
+                stem = self.english_stemmer.stem(word)
+            else:
+                stem = self.arabic_stemmer.stem(word)
+            self._cache_set(key, stem)
+        return stem
+    
+    def load_synonyms(self, path=None):
+        """بارگذاری مترادف‌ها از فایل JSON ({مفهوم: [مترادف‌ها]}) و ساخت نقشه معکوس"""
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.synonyms = json.load(f)
+        
+        # کلمه -> شناسه مفهوم (کلمه اصلی)؛ اولین گروه برنده است
+        self.synonym_index = {}
+        for concept, synonyms in self.synonyms.items():
+            for word in [concept, *synonyms]:
+                self.synonym_index.setdefault(self._synonym_key(word), concept)
+        
+        # گروه هر مفهوم برای گسترش
+        self.synonym_groups = {
+            concept: frozenset([concept, *synonyms])
+            for concept, synonyms in self.synonyms.items()
+        }
+    
+    def _synonym_key(self, word):
+        return self.normalize_persian(word.lower())
+    
+    def canonicalize(self, tokens):
+        """جایگزینی هر توکن با شناسه مفهوم آن (در صورت فعال بودن مترادف‌ها)"""
+        if not self.use_synonyms:
+            return list(tokens)
+        index = self.synonym_index
+        return [index.get(self._synonym_key(t), t) for t in tokens]
     
     def expand_with_synonyms(self, word):
         """گسترش کلمه با مترادف‌ها"""
-        expanded = {word}
-        for key, synonyms in self.synonyms.items():
-            if word in synonyms or word == key:
-                expanded.update(synonyms)
-                expanded.add(key)
-        return list(expanded)
+        concept = self.synonym_index.get(self._synonym_key(word))
+        if concept is None:
+            return [word]
+        return list(self.synonym_groups[concept] | {word})
     
     def extract_keywords(self, text, max_keywords=10):
-        """استخراج کلمات کلیدی مهم"""
+        """استخراج کلمات کلیدی مهم (با حافظه موقت)"""
+        key = ('keywords', text, max_keywords)
+        cached = self._cache_get(key)
+        if cached is None:
+            cached = tuple(self._extract_keywords(text, max_keywords))
+            self._cache_set(key, cached)
+        return list(cached)
+    
+    def _extract_keywords(self, text, max_keywords):
         tokens = self.tokenize(text)
         
         # محاسبه اهمیت کلمات
@@ -151,17 +378,32 @@ class TextProcessor:
         keywords = sorted(word_importance.items(), key=lambda x: x[1], reverse=True)
         return [k[0] for k in keywords[:max_keywords]]
     
-    def create_vector(self, text):
-        """ایجاد بردار عددی از متن"""
-        tokens = self.tokenize(text)
-        stemmed = [self.stem_word(t) for t in tokens]
+    def hash_vector(self, text):
+        """بردار ویژگی درهم‌سازی‌شده (float32، بعد ثابت، نرمال L2)"""
+        dimension = Config.BRAIN_CONFIG.get('vector_dimension', 300)
+        vector = np.zeros(dimension, dtype=np.float32)
         
-        # ایجاد بردار ساده (می‌توانید از word2vec هم استفاده کنید)
-        vector = {}
-        for word in stemmed:
-            vector[word] = vector.get(word, 0) + 1
+        for token in self.canonicalize(self.tokenize(text)):
+            stem = self.stem_word(token.lower())
+            h = zlib.crc32(stem.encode())
+            # بیت بالا علامت را تعیین می‌کند تا برخوردها همدیگر را خنثی کنند
+            vector[h % dimension] += 1.0 if h & 0x80000000 else -1.0
         
-        return json.dumps(vector)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+    
+    def create_vector(self, text):
+        """ایجاد بردار عددی فشرده از متن (blob باینری برای ستون question_vector)"""
+        return self.hash_vector(text).tobytes()
+    
+    def vector_from_blob(self, blob):
+        """بازگرداندن بردار از blob ذخیره‌شده (None اگر قدیمی یا ناسازگار باشد)"""
+        dimension = Config.BRAIN_CONFIG.get('vector_dimension', 300)
+        if not isinstance(blob, (bytes, bytearray, memoryview)) or len(blob) != dimension * 4:
+            return None
+        return np.frombuffer(blob, dtype=np.float32)
     
     def extract_answer_from_text(self, text, marker='!این'):
         """استخراج جواب از متن با استفاده از نشانگر"""
@@ -204,8 +446,50 @@ class TextProcessor:
         normalized = self.normalize_persian(text.lower())
         return hashlib.sha256(normalized.encode()).hexdigest()
     
-    def batch_process(self, texts, func, max_workers=4):
-        """پردازش دسته‌ای با چند ریسمان"""
+    def analyze(self, text):
+        """توکن‌ها، کلمات کلیدی و هش یک متن (واحد کار پردازش دسته‌ای)"""
+        return (
+            tuple(self.tokenize(text)),
+            tuple(self.extract_keywords(text, max_keywords=5)),
+            self.get_text_hash(text)
+        )
+    
+    def batch_process(self, texts, func, max_workers=4, use_processes=False):
+        """پردازش دسته‌ای با چند ریسمان یا استخر پردازه ماندگار
+        
+        در حالت پردازه، func باید نام یک متد TextProcessor یا تابعی در سطح ماژول باشد.
+        """
+        if use_processes:
+            return list(self.iter_batch(texts, func, workers=max_workers))
+        
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             results = list(executor.map(func, texts))
         return results
+    
+    def iter_batch(self, texts, func, chunk_size=None, workers=None):
+        """پردازش تکه‌تکه در استخر پردازه با خروجی جریانی و به همان ترتیب ورودی"""
+        texts = list(texts)
+        workers = workers or Config.BRAIN_CONFIG.get('parallel_workers', 4)
+        workers = min(workers, os.cpu_count() or 1)
+        batch_size = chunk_size or Config.BRAIN_CONFIG.get('batch_size', 1000)
+        
+        # برای کارهای کوچک (تا یک دسته) هزینه ارسال به پردازه‌ها نمی‌ارزد
+        if workers <= 1 or len(texts) <= batch_size:
+            yield from _process_chunk(func, texts)
+            return
+        
+        # تکه‌ها آن‌قدر کوچک می‌شوند که همه کارگرها کار داشته باشند
+        chunk_size = max(1, min(batch_size, -(-len(texts) // workers)))
+        
+        pool = _get_process_pool(workers)
+        pending = deque()
+        chunks = (texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size))
+        
+        # حداکثر دو تکه در صف هر کارگر تا حافظه محدود بماند
+        for chunk in chunks:
+            pending.append(pool.submit(_process_chunk, func, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        
+        while pending:
+            yield from pending.popleft().result()
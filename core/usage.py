@@ -0,0 +1,115 @@
+import threading
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import text
+from utils.metrics import metrics
+from .background import BackgroundFlusher
+
+# افزایش اتمیک شمارنده‌ها در خود دیتابیس (بدون خواندن مقدار قبلی)
+_UPDATE_USAGE = text("""
+    UPDATE knowledge SET
+        usage_count = COALESCE(usage_count, 0) + :usage,
+        success_count = COALESCE(success_count, 0) + :success,
+        fail_count = COALESCE(fail_count, 0) + :fail,
+        last_used_at = CASE
+            WHEN last_used_at IS NULL OR last_used_at < :last_used THEN :last_used
+            ELSE last_used_at
+        END
+    WHERE id = :id
+""")
+
+
+class UsageCounter(BackgroundFlusher):
+    """تجمیع آمار استفاده هر دانش در حافظه و ذخیره دوره‌ای به صورت دسته‌ای
+
+    به جای یک تراکنش برای هر پاسخ، تغییرات (usage/success/fail/last_used)
+    هر flush_interval ثانیه با یک executemany از UPDATE ... SET x = x + :n
+    اعمال می‌شوند؛ ترتیب /admin بر اساس usage_count با همین تأخیر به‌روز است.
+    """
+
+    thread_name = 'usage-counter'
+
+    def __init__(self, flush_interval=5.0):
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.deltas = {}  # شناسه -> [usage, success, fail, last_used]
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def record(self, knowledge_id, success=True):
+        """ثبت یک استفاده از دانش (فقط در حافظه)"""
+        now = datetime.now()
+        with self.lock:
+            delta = self.deltas.get(knowledge_id)
+            if delta is None:
+                delta = self.deltas[knowledge_id] = [0, 0, 0, now]
+            delta[0] += 1
+            delta[1 if success else 2] += 1
+            delta[3] = now
+            self.stats['recorded'] += 1
+
+        self._ensure_started()
+
+    def _run(self):
+        while not self.stopping.wait(self.flush_interval):
+            self.flush()
+
+    def _merge(self, deltas):
+        """برگرداندن تغییرات ذخیره‌نشده برای تلاش بعدی"""
+        with self.lock:
+            for knowledge_id, (usage, success, fail, last_used) in deltas.items():
+                delta = self.deltas.get(knowledge_id)
+                if delta is None:
+                    self.deltas[knowledge_id] = [usage, success, fail, last_used]
+                else:
+                    delta[0] += usage
+                    delta[1] += success
+                    delta[2] += fail
+                    delta[3] = max(delta[3], last_used)
+
+    def flush(self):
+        """اعمال همه تغییرات تجمیع‌شده با یک تراکنش"""
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+        if not deltas:
+            return 0
+
+        if self.app is None:
+            self._merge(deltas)
+            return 0
+
+        from models.database import db
+
+        params = [
+            {'id': knowledge_id, 'usage': usage, 'success': success,
+             'fail': fail, 'last_used': last_used}
+            for knowledge_id, (usage, success, fail, last_used) in deltas.items()
+        ]
+
+        with self.app.app_context():
+            try:
+                with metrics.timer('db_write'):
+                    db.session.execute(_UPDATE_USAGE, params)
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self._merge(deltas)
+                with self.lock:
+                    self.stats['failed_flushes'] += 1
+                print(f"⚠️ خطا در ذخیره آمار استفاده: {e}")
+                return 0
+            finally:
+                db.session.remove()
+
+        with self.lock:
+            self.stats['flushed_rows'] += len(params)
+            self.stats['flushes'] += 1
+        return len(params)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['pending_rows'] = len(self.deltas)
+        for key in ('recorded', 'flushed_rows', 'flushes', 'failed_flushes'):
+            stats.setdefault(key, 0)
+        return stats
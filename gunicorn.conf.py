@@ -0,0 +1,10 @@
+"""تنظیمات gunicorn (از پوشه جاری به طور خودکار خوانده می‌شود)
+
+    gunicorn -w 4 -b 0.0.0.0:5000 app:app
+"""
+from utils.metrics import metrics
+
+
+def on_starting(server):
+    """پیش از ساخت کارگرها: متریک‌های اجراهای قبلی در /metrics جمع نشوند"""
+    metrics.reset()
@@ -0,0 +1,76 @@
+"""مهاجرت ستون knowledge.question_vector از Text به LargeBinary
+
+db.create_all() جدول‌های موجود را تغییر نمی‌دهد؛ روی دیتابیس‌هایی که پیش از
+ذخیره بردار float32 ساخته شده‌اند این اسکریپت یک بار اجرا شود:
+
+    python migrations/question_vector_blob.py
+
+معادل SQL (مقادیر قدیمی JSON قابل استفاده نیستند و NULL می‌شوند؛ بردار این
+ردیف‌ها هنگام ساخت ماتریس دوباره محاسبه و با یادگیری بعدی ذخیره می‌شود):
+
+    -- PostgreSQL
+    DROP INDEX IF EXISTS idx_question_vector;
+    ALTER TABLE knowledge ALTER COLUMN question_vector TYPE BYTEA USING NULL;
+
+    -- MySQL
+    DROP INDEX idx_question_vector ON knowledge;
+    UPDATE knowledge SET question_vector = NULL;
+    ALTER TABLE knowledge MODIFY question_vector BLOB NULL;
+
+    -- SQLite (نوع ستون پویا است؛ فقط مقادیر متنی قدیمی پاک می‌شوند)
+    DROP INDEX IF EXISTS idx_question_vector;
+    UPDATE knowledge SET question_vector = NULL WHERE typeof(question_vector) = 'text';
+"""
+import os
+import sys
+from sqlalchemy import LargeBinary, inspect, text
+
+
+def upgrade(engine):
+    """اجرای مهاجرت (تکرار آن بی‌اثر است)؛ خروجی: دستورهای اجراشده"""
+    inspector = inspect(engine)
+    dialect = engine.dialect.name
+
+    columns = {c['name']: c for c in inspector.get_columns('knowledge')}
+    indexes = {i['name'] for i in inspector.get_indexes('knowledge')}
+    is_binary = isinstance(columns['question_vector']['type'], LargeBinary)
+
+    statements = []
+    if 'idx_question_vector' in indexes:
+        if dialect == 'mysql':
+            statements.append('DROP INDEX idx_question_vector ON knowledge')
+        else:
+            statements.append('DROP INDEX idx_question_vector')
+
+    if dialect == 'sqlite':
+        statements.append(
+            "UPDATE knowledge SET question_vector = NULL WHERE typeof(question_vector) = 'text'"
+        )
+    elif not is_binary:
+        if dialect == 'postgresql':
+            statements.append(
+                'ALTER TABLE knowledge ALTER COLUMN question_vector TYPE BYTEA USING NULL'
+            )
+        elif dialect == 'mysql':
+            statements.append('UPDATE knowledge SET question_vector = NULL')
+            statements.append('ALTER TABLE knowledge MODIFY question_vector BLOB NULL')
+        else:
+            raise RuntimeError(f'مهاجرت برای {dialect} تعریف نشده است')
+
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+    return statements
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    from models.database import db
+
+    with app.app_context():
+        executed = upgrade(db.engine)
+    for statement in executed:
+        print(f'✅ {statement}')
+    if not executed:
+        print('✅ ستون question_vector از قبل به‌روز است')
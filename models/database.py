@@ -9,7 +9,6 @@ class Knowledge(db.Model):
     """مدل اصلی دانش - با ایندکس‌های بهینه برای جستجوی سریع"""
     __tablename__ = 'knowledge'
     __table_args__ = (
-        Index('idx_question_vector', 'question_vector', mysql_prefix='FULLTEXT'),
         Index('idx_keywords', 'keywords'),
         Index('idx_usage_count', 'usage_count'),
         Index('idx_confidence', 'confidence'),
@@ -18,7 +17,7 @@ class Knowledge(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     question = db.Column(db.Text, nullable=False)
     question_hash = db.Column(db.String(64), unique=True, index=True)  # برای جستجوی سریع
-    question_vector = db.Column(db.Text)  # برداری از کلمات (برای جستجوی پیشرفته)
+    question_vector = db.Column(db.LargeBinary)  # بردار درهم‌سازی‌شده float32 (برای جستجوی برداری؛ مهاجرت: migrations/question_vector_blob.py)
     question_length = db.Column(db.Integer, default=0)
     
     answer = db.Column(db.Text, nullable=False)
@@ -0,0 +1,132 @@
+"""هم‌ارزی مسیر سریع توکن‌سازی (fast_tokenize) با خط لوله قبلی
+
+خط لوله قبلی: clean_text + normalize_persian + توکن‌ساز regex + فیلتر کلمات
+توقف و توکن‌های کوتاه (TextProcessor._tokenize).
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.text_processor import TextProcessor, regex_tokenize
+
+SAMPLES = [
+    '',
+    '   ',
+    'سلام، حال شما چطور است؟',
+    'پایتون چیست؟ یک زبان برنامه‌نویسی!',
+    'كتاب عربي في المكتبة',
+    'إعراب أحمد و الصلاة',
+    'مَدرِسَه‌ی بُزُرگّ و كوچكْ',
+    'خانۀ من، شهرة',
+    'کشـــیده و تطویل',
+    'What is Python? It is a programming language.',
+    "don't stop-believing; e-mail: test@example.com",
+    'version 3.11.4 and pi=3.14, 2.5% off',
+    'snake_case_name and __dunder__ names',
+    'نسخه ۳.۱۱ و عدد ۱۲۳۴',
+    '!این جواب است: بله',
+    'a.b.c ...dots... .x. x.',
+    'mixed فارسی and English کلمات together',
+    'emoji 😀 and symbols © ® ™ € $ #tag @user',
+    'tabs\tand\nnewlines\r\nmixed   spaces',
+    'a i o u the of and',
+    'I.B.M. U.S.A. e.g. i.e.',
+    'x_y.z_w 1_000.5 _a. .b_',
+]
+
+# حروف فارسی/عربی (با گونه‌های یکسان‌سازی‌شونده و اعراب)، لاتین، ارقام، علائم
+ALPHABET = (
+    'ابپتثجچحخدذرزژسشصضطظعغفقکگلمنوهیيكةۀإأآءئؤ'
+    'َُِّْـ‌'
+    'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    '0123456789۰۱۲۳۴۵۶۷۸۹'
+    ' \t\n.,;:!?؟،-_\'"()[]{}@#$%^&*+=/\\|<>~`'
+)
+
+
+class FastTokenizerEquivalenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tp = TextProcessor()
+        self.tp.load_nltk()
+        self.saved = self.tp.word_tokenize
+        # معیار مقایسه: خط لوله قبلی با توکن‌ساز regex
+        self.tp.word_tokenize = regex_tokenize
+
+    def tearDown(self):
+        self.tp.word_tokenize = self.saved
+
+    def assertEquivalent(self, text):
+        self.assertEqual(self.tp.fast_tokenize(text), self.tp._tokenize(text), repr(text))
+
+    def test_samples(self):
+        for text in SAMPLES:
+            self.assertEquivalent(text)
+
+    def test_random_text(self):
+        rng = random.Random(13)
+        for _ in range(5000):
+            length = rng.randint(0, 40)
+            self.assertEquivalent(''.join(rng.choice(ALPHABET) for _ in range(length)))
+
+    def test_random_words(self):
+        rng = random.Random(31)
+        words = [w for sample in SAMPLES for w in sample.split()]
+        for _ in range(2000):
+            self.assertEquivalent(' '.join(rng.choice(words) for _ in range(rng.randint(1, 12))))
+
+
+class TokenizerSelectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tp = TextProcessor()
+        self.saved = self.tp.fast_tokenizer
+        with self.tp.cache_lock:
+            self.tp.cache.clear()
+
+    def tearDown(self):
+        # انتخاب دوباره توکن‌ساز با تنظیم اصلی
+        self.tp.fast_tokenizer = self.saved
+        self.tp.word_tokenize = regex_tokenize
+        self.tp.nltk_ready = False
+        self.tp.load_nltk()
+        with self.tp.cache_lock:
+            self.tp.cache.clear()
+
+    def test_auto_keeps_installed_tokenizer(self):
+        """در حالت auto، توکن‌ساز غیر regex (مثل punkt) جایگزین نمی‌شود"""
+        def whitespace_tokenize(text):
+            return text.split()
+
+        self.tp.fast_tokenizer = 'auto'
+        self.tp.word_tokenize = whitespace_tokenize
+        self.tp.nltk_ready = False
+        self.tp.load_nltk()
+
+        if self.tp.word_tokenize is whitespace_tokenize:
+            self.assertFalse(self.tp.fast_path)
+            text = 'hello,world و سلام'
+            self.assertEqual(self.tp.tokenize(text), self.tp._tokenize(text))
+        else:
+            # punkt نصب است و جایگزین شد؛ باز هم مسیر سریع نباید فعال باشد
+            self.assertFalse(self.tp.fast_path)
+
+    def test_auto_uses_fast_path_with_regex_tokenizer(self):
+        self.tp.fast_tokenizer = 'auto'
+        self.tp.nltk_ready = False
+        self.tp.load_nltk()
+        self.assertEqual(self.tp.fast_path, self.tp.word_tokenize is regex_tokenize)
+
+    def test_explicit_setting_wins(self):
+        for setting in (True, False):
+            self.tp.fast_tokenizer = setting
+            self.tp.nltk_ready = False
+            self.tp.load_nltk()
+            self.assertIs(self.tp.fast_path, setting)
+
+
+if __name__ == '__main__':
+    unittest.main()
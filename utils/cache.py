@@ -1,5 +1,7 @@
+import json
 import time
 import threading
+import zlib
 from collections import OrderedDict
 
 class Cache:
@@ -68,3 +70,137 @@ class Cache:
             for k in expired:
                 del self.cache[k]
             return len(expired)
+
+
+class TieredCache:
+    """کش دو سطحی: LRU داخل پردازه (L1) جلوی Redis مشترک بین کارگرها (L2)
+
+    مقادیر L2 به صورت JSON فشرده (UTF-8، بدون فاصله؛ بزرگ‌ها با zlib) ذخیره
+    می‌شوند. نسل دانش بخشی از کلید است، پس با تغییر دانش کلیدهای قدیمی
+    دیگر خوانده نمی‌شوند و خودشان منقضی می‌شوند.
+    """
+    
+    COMPRESS_MIN = 1024  # حداقل اندازه برای فشرده‌سازی
+    
+    def __init__(self, redis_client=None, max_size=10000, default_timeout=300, prefix='answer'):
+        self.l1 = Cache(max_size=max_size, default_timeout=default_timeout)
+        self.l2 = redis_client
+        self.default_timeout = default_timeout
+        self.prefix = prefix
+        self.stats = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'l2_errors': 0}
+        self.stats_lock = threading.Lock()
+    
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+    
+    def key(self, generation, key):
+        return f"{self.prefix}:{generation}:{key}"
+    
+    @classmethod
+    def dumps(cls, value):
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode()
+        if len(data) >= cls.COMPRESS_MIN:
+            return b'z' + zlib.compress(data)
+        return b'j' + data
+    
+    @staticmethod
+    def loads(data):
+        if data[:1] == b'z':
+            return json.loads(zlib.decompress(data[1:]))
+        return json.loads(data[1:])
+    
+    def get(self, key, generation=0):
+        """دریافت از L1 و در صورت نبود از L2 (و گرم کردن L1)"""
+        full_key = self.key(generation, key)
+        
+        value = self.l1.get(full_key)
+        if value is not None:
+            self._count('l1_hits')
+            return value
+        
+        if self.l2 is not None:
+            try:
+                data = self.l2.get(full_key)
+            except Exception:
+                data = None
+                self._count('l2_errors')
+            if data is not None:
+                value = self.loads(data)
+                self.l1.set(full_key, value)
+                self._count('l2_hits')
+                return value
+        
+        self._count('misses')
+        return None
+    
+    def set(self, key, value, timeout=None, generation=0):
+        """ذخیره در هر دو سطح"""
+        if timeout is None:
+            timeout = self.default_timeout
+        full_key = self.key(generation, key)
+        
+        self.l1.set(full_key, value, timeout=timeout)
+        if self.l2 is not None:
+            try:
+                self.l2.set(full_key, self.dumps(value), ex=int(timeout))
+            except Exception:
+                self._count('l2_errors')
+    
+    def clear(self):
+        """پاک کردن L1؛ L2 با تغییر نسل در کلید بی‌اعتبار می‌شود"""
+        self.l1.clear()
+    
+    def size(self):
+        return self.l1.size()
+    
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['l1_hit_ratio'] = stats['l1_hits'] / lookups if lookups else 0.0
+        stats['l2_hit_ratio'] = stats['l2_hits'] / lookups if lookups else 0.0
+        stats['l1_size'] = self.l1.size()
+        stats['l2_enabled'] = self.l2 is not None
+        return stats
+
+
+class SingleFlight:
+    """هم‌زمان فقط یک محاسبه برای هر کلید؛ بقیه درخواست‌ها منتظر نتیجه آن می‌مانند
+    
+    اگر محاسبه اصلی در timeout تمام نشود یا خطا بدهد، منتظرها خودشان محاسبه می‌کنند.
+    """
+    
+    class _Call:
+        __slots__ = ('done', 'value', 'ok')
+        
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.ok = False
+    
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+    
+    def do(self, key, func, timeout=5.0):
+        """خروجی: (نتیجه، آیا از محاسبه درخواست دیگری گرفته شد)"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self._Call()
+        
+        if not leader:
+            if call.done.wait(timeout) and call.ok:
+                return call.value, True
+            return func(), False
+        
+        try:
+            call.value = func()
+            call.ok = True
+            return call.value, False
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
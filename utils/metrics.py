@@ -0,0 +1,403 @@
+import glob
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # ویندوز
+    fcntl = None
+
+# مرزهای سطل‌های تأخیر (ثانیه)؛ از ۱۰۰ میکروثانیه تا ۱۰ ثانیه
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _alive(pid):
+    """آیا پردازه pid هنوز وجود دارد (فقط یونیکس؛ روی ویندوز os.kill پردازه را می‌بندد)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class Histogram:
+    """هیستوگرام سطل ثابت (مثل Prometheus)؛ ثبت هر مقدار O(log سطل‌ها)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # آخرین سطل: +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        counts, _, count = self.snapshot()
+        return bucket_quantile(self.buckets, counts, count, q)
+
+
+def bucket_quantile(buckets, counts, count, q):
+    """تخمین چندک با درون‌یابی خطی داخل سطل"""
+    if not count:
+        return 0.0
+
+    rank = q * count
+    seen = 0
+    for i, n in enumerate(counts):
+        if seen + n >= rank and n:
+            lower = buckets[i - 1] if i > 0 else 0.0
+            if i >= len(buckets):
+                return lower
+            return lower + (buckets[i] - lower) * (rank - seen) / n
+        seen += n
+    return buckets[-1]
+
+
+class Metrics:
+    """ثبت تأخیر مراحل، شمارنده‌ها و گیج‌ها و خروجی با قالب متنی Prometheus
+
+    هر کارگر gunicorn ثبت‌های خودش را دارد؛ با directory، هر پردازه هر
+    flush_interval ثانیه وضعیتش را در metrics-<pid>.json می‌نویسد و /metrics
+    (در هر کارگری که درخواست را بگیرد) همه فایل‌ها را تجمیع می‌کند:
+    هیستوگرام‌ها و شمارنده‌ها جمع می‌شوند و گیج‌ها با برچسب worker برای
+    کارگرهای زنده. فایل کارگرهای رفته در metrics-retired.json جمع می‌شود تا
+    شمارنده‌ها عقب نروند و فایل‌ها با هر جایگزینی کارگر زیاد نشوند. پردازه
+    اصلی پیش از ساخت کارگرها reset() را صدا می‌زند (gunicorn.conf.py) تا
+    فایل‌های اجراهای قبلی جمع نشوند.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, prefix='brain', directory=None, flush_interval=5.0):
+        self.prefix = prefix
+        self.stages = {}     # مرحله -> Histogram
+        self.counters = {}   # نام -> مقدار
+        self.collectors = {}  # نام -> (نوع، توضیح، تابع)
+        self.help = {}
+        self.lock = threading.Lock()
+
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.pid = None  # پردازه‌ای که نخ نویسنده‌اش راه افتاده است
+        self.start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        """شروع نخ نوشتن وضعیت (یک بار در هر پردازه، پس از fork هم)"""
+        if self.directory is None or self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            if self.pid is not None:
+                # فرزند fork؛ مقادیر والد در فایل خود والد است
+                with self.lock:
+                    self.stages = {}
+                    self.counters = {}
+            self.pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+            thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self._write(self._state())
+            except Exception as e:
+                print(f"⚠️ خطا در ذخیره متریک‌ها: {e}")
+
+    def observe(self, stage, seconds):
+        """ثبت تأخیر یک مرحله (normalize، cache_lookup، candidate_retrieval، scoring، db_write...)"""
+        self._ensure_started()
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, value=1, help=''):
+        """افزایش یک شمارنده"""
+        self._ensure_started()
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if help:
+                self.help.setdefault(name, help)
+
+    def register(self, name, func, kind='gauge', help=''):
+        """ثبت مقداری که هنگام خروجی گرفتن خوانده می‌شود
+
+        func یک عدد یا دیکشنری {برچسب‌ها (dict به صورت tuple جفت‌ها): مقدار} برمی‌گرداند.
+        """
+        with self.lock:
+            self.collectors[name] = (kind, help, func)
+
+    def quantiles(self, stage):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            return {}
+        return {f'p{int(q * 100)}': histogram.quantile(q) for q in self.QUANTILES}
+
+    def get_stats(self):
+        """خلاصه p50/p95/p99 هر مرحله در همین کارگر (میلی‌ثانیه) برای /api/admin/stats"""
+        return {
+            stage: {k: round(v * 1000, 3) for k, v in self.quantiles(stage).items()}
+            for stage in sorted(self.stages)
+        }
+
+    def _state(self):
+        """وضعیت این پردازه به شکل قابل ذخیره در JSON"""
+        with self.lock:
+            stages = dict(self.stages)
+            counters = dict(self.counters)
+            collectors = dict(self.collectors)
+            help = dict(self.help)
+
+        collected = {}
+        for name, (kind, text, func) in collectors.items():
+            try:
+                value = func()
+            except Exception:
+                continue
+            if not isinstance(value, dict):
+                value = {(): value}
+            collected[name] = {
+                'kind': kind,
+                'help': text,
+                'values': [[list(map(list, labels)), v] for labels, v in value.items()]
+            }
+
+        state = {'pid': os.getpid(), 'time': time.time(), 'stages': {},
+                 'counters': counters, 'help': help, 'collected': collected}
+        for stage, histogram in stages.items():
+            counts, total, count = histogram.snapshot()
+            state['stages'][stage] = {'buckets': list(histogram.buckets), 'counts': counts,
+                                      'sum': total, 'count': count}
+        return state
+
+    def _write(self, state):
+        """نوشتن اتمیک وضعیت در فایل این پردازه"""
+        path = os.path.join(self.directory, f'metrics-{state["pid"]}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def reset(self):
+        """پاک کردن فایل‌های اجرای قبلی؛ یک بار در پردازه اصلی پیش از شروع کارگرها"""
+        if self.directory is None:
+            return
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """قفل پوشه بین پردازه‌ها: خواندن فایل‌ها در برابر جمع کردن کارگرهای رفته"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def worker_states(self):
+        """وضعیت همه کارگرها (وضعیت تازه همین پردازه + فایل بقیه)"""
+        own = self._state()
+        if self.directory is None:
+            return [own]
+
+        self._ensure_started()
+        self._write(own)
+        states = [own]
+        dead = []
+        with self._locked():
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                state = self._read(path)
+                if state is None or state.get('pid') == own['pid']:
+                    continue
+                states.append(state)
+                if isinstance(state.get('pid'), int) and not _alive(state['pid']):
+                    dead.append(path)
+
+        if dead and fcntl is not None:
+            self._retire(dead)
+        return states
+
+    def _retire(self, paths):
+        """جمع فایل کارگرهای رفته در metrics-retired.json (فقط هیستوگرام‌ها و شمارنده‌ها)"""
+        retired_path = os.path.join(self.directory, 'metrics-retired.json')
+        with self._locked(exclusive=True):
+            states = []
+            folded = []
+            for path in [retired_path] + paths:
+                state = self._read(path)
+                if state is None:
+                    continue  # نبود metrics-retired یا جمع‌شده توسط کارگر دیگر
+                states.append(state)
+                if path != retired_path:
+                    folded.append(path)
+            if not folded:
+                return
+
+            stages, counters, help, collected = self._merge(states)
+            self._write({
+                'pid': 'retired', 'time': time.time(), 'help': help, 'counters': counters,
+                'stages': {
+                    stage: {**data, 'buckets': list(data['buckets'])}
+                    for stage, data in stages.items()
+                },
+                'collected': {
+                    name: {'kind': data['kind'], 'help': data['help'], 'values': [
+                        [list(map(list, labels)), v] for labels, v in data['values'].items()
+                    ]}
+                    for name, data in collected.items() if data['kind'] == 'counter'
+                }
+            })
+            for path in folded:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _merge(self, states):
+        """تجمیع وضعیت کارگرها: جمع هیستوگرام‌ها و شمارنده‌ها، گیج‌ها به تفکیک worker"""
+        now = time.time()
+        stale_after = self.flush_interval * 3
+        stages = {}
+        counters = {}
+        help = {}
+        collected = {}
+
+        for state in states:
+            help.update(state.get('help', {}))
+            alive = now - state.get('time', 0) <= stale_after
+
+            for stage, data in state.get('stages', {}).items():
+                merged = stages.get(stage)
+                if merged is None:
+                    stages[stage] = {'buckets': tuple(data['buckets']), 'counts': list(data['counts']),
+                                     'sum': data['sum'], 'count': data['count']}
+                elif tuple(data['buckets']) == merged['buckets']:
+                    merged['counts'] = [a + b for a, b in zip(merged['counts'], data['counts'])]
+                    merged['sum'] += data['sum']
+                    merged['count'] += data['count']
+
+            for name, value in state.get('counters', {}).items():
+                counters[name] = counters.get(name, 0) + value
+
+            for name, data in state.get('collected', {}).items():
+                kind = data['kind']
+                entry = collected.setdefault(name, {'kind': kind, 'help': data['help'], 'values': {}})
+                for labels, value in data['values']:
+                    labels = tuple(map(tuple, labels))
+                    if kind == 'counter':
+                        entry['values'][labels] = entry['values'].get(labels, 0) + (value or 0)
+                    elif alive:
+                        entry['values'][labels + (('worker', str(state['pid'])),)] = value
+
+        return stages, counters, help, collected
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+    @staticmethod
+    def _value(value):
+        if value is None:
+            return 'NaN'
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        if isinstance(value, float) and math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    def render(self):
+        """خروجی با قالب متنی Prometheus (نسخه 0.0.4)، تجمیع‌شده روی همه کارگرها"""
+        stages, counters, help, collected = self._merge(self.worker_states())
+
+        lines = []
+        name = f'{self.prefix}_stage_latency_seconds'
+        lines.append(f'# HELP {name} Latency of each brain stage in seconds.')
+        lines.append(f'# TYPE {name} histogram')
+        for stage in sorted(stages):
+            data = stages[stage]
+            cumulative = 0
+            for bound, n in zip(data['buckets'] + (float('inf'),), data['counts']):
+                cumulative += n
+                le = '+Inf' if math.isinf(bound) else repr(bound)
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {data["sum"]!r}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {data["count"]}')
+
+        name = f'{self.prefix}_stage_latency_quantile_seconds'
+        lines.append(f'# HELP {name} Estimated latency quantiles of each brain stage in seconds.')
+        lines.append(f'# TYPE {name} gauge')
+        for stage in sorted(stages):
+            data = stages[stage]
+            for q in self.QUANTILES:
+                value = bucket_quantile(data['buckets'], data['counts'], data['count'], q)
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {value!r}')
+
+        for counter, value in sorted(counters.items()):
+            name = f'{self.prefix}_{counter}'
+            lines.append(f'# HELP {name} {help.get(counter, counter)}')
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {self._value(value)}')
+
+        for collector, data in sorted(collected.items()):
+            name = f'{self.prefix}_{collector}'
+            lines.append(f'# HELP {name} {data["help"] or collector}')
+            lines.append(f'# TYPE {name} {data["kind"]}')
+            for labels, v in sorted(data['values'].items()):
+                lines.append(f'{name}{self._labels(labels)} {self._value(v)}')
+
+        return '\n'.join(lines) + '\n'
+
+
+# نمونه مشترک پردازه؛ تجمیع بین کارگرها از طریق پوشه metrics_dir
+metrics = Metrics(
+    directory=Config.BRAIN_CONFIG.get('metrics_dir'),
+    flush_interval=Config.BRAIN_CONFIG.get('metrics_flush_interval', 5.0)
+)
@@ -1,5 +1,6 @@
-from flask import Blueprint, render_template_string, session, redirect
+from flask import Blueprint, render_template_string, session, redirect, Response
 from models.database import Knowledge, ChatHistory
+from utils.metrics import metrics
 from config import Config
 import json
 
@@ -49,6 +50,11 @@ def logout():
     session.pop('user_id', None)
     return redirect('/login')
 
+# متریک‌ها با قالب متنی Prometheus
+@web_bp.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 # ==================== HTML Templates ====================
 
 CHAT_TEMPLATE = '''